@@ -0,0 +1,144 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from db import get_db, Incident, Factory, FactoryRiskRollup
+from incident_query import applyIncidentFilters, monthOf
+from model import IncidentFilters, ThreatTypeCount, ThreatTypeCounts, FactoryThreatTypeCount, FactoryThreatTypeCounts, FactoryMonthlyCount, FactoryMonthlyCounts, FactoryRiskIndex, FactoryRiskIndexes, FactoryMonthlyRisk, FactoryMonthlyRisks
+from reference_cache import referenceDataCache
+
+router = APIRouter(prefix="/analytics")
+
+@router.get("/threatTypes", response_model=ThreatTypeCounts)
+def getThreatTypeCounts(filters: IncidentFilters = Depends(), db: Session = Depends(get_db)):
+  query = db.query(Incident.threatType_id, func.count(Incident.id))
+  rows = applyIncidentFilters(query, filters).group_by(Incident.threatType_id).all()
+
+  counts = []
+  for threatType_id, count in rows:
+    threatType = referenceDataCache.get(db, "threatType", threatType_id)
+    if threatType is not None:
+      counts.append(ThreatTypeCount(threatType=threatType, count=count))
+  counts.sort(key=lambda threatTypeCount: threatTypeCount.count, reverse=True)
+  return ThreatTypeCounts(counts=counts)
+
+@router.get("/factories/threatTypes", response_model=FactoryThreatTypeCounts)
+def getFactoryThreatTypeCounts(filters: IncidentFilters = Depends(), db: Session = Depends(get_db)):
+  query = (
+    db.query(Incident.factory_id, Factory.name, Incident.threatType_id, func.count(Incident.id))
+    .join(Factory, Factory.id == Incident.factory_id)
+  )
+  rows = (
+    applyIncidentFilters(query, filters)
+    .group_by(Incident.factory_id, Factory.name, Incident.threatType_id)
+    .order_by(Incident.factory_id, Incident.threatType_id)
+    .all()
+  )
+
+  counts = []
+  for factory_id, factoryName, threatType_id, count in rows:
+    threatType = referenceDataCache.get(db, "threatType", threatType_id)
+    if threatType is not None:
+      counts.append(FactoryThreatTypeCount(factory_id=factory_id, factory=factoryName, threatType=threatType, count=count))
+  return FactoryThreatTypeCounts(counts=counts)
+
+@router.get("/factories/monthly", response_model=FactoryMonthlyCounts)
+def getFactoryMonthlyCounts(filters: IncidentFilters = Depends(), db: Session = Depends(get_db)):
+  month = monthOf(Incident.date, db).label("month")
+  query = (
+    db.query(Incident.factory_id, Factory.name, month, func.count(Incident.id), func.avg(Incident.threatLevel))
+    .join(Factory, Factory.id == Incident.factory_id)
+  )
+  rows = (
+    applyIncidentFilters(query, filters)
+    .group_by(Incident.factory_id, Factory.name, month)
+    .order_by(month, Incident.factory_id)
+    .all()
+  )
+
+  return FactoryMonthlyCounts(counts=[
+    FactoryMonthlyCount(
+      factory_id=factory_id,
+      factory=factoryName,
+      month=monthValue,
+      count=count,
+      averageThreatLevel=float(averageThreatLevel or 0)
+    )
+    for factory_id, factoryName, monthValue, count, averageThreatLevel in rows
+  ])
+
+def filterRiskRollup(query, monthFrom: Optional[str], monthTo: Optional[str], factory_id: Optional[int]):
+  if monthFrom is not None:
+    query = query.filter(FactoryRiskRollup.month >= monthFrom)
+  if monthTo is not None:
+    query = query.filter(FactoryRiskRollup.month <= monthTo)
+  if factory_id is not None:
+    query = query.filter(FactoryRiskRollup.factory_id == factory_id)
+  return query
+
+@router.get("/riskIndex", response_model=FactoryRiskIndexes)
+def getRiskIndex(
+  monthFrom: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+  monthTo: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+  factory_id: Optional[int] = None,
+  db: Session = Depends(get_db)
+):
+  # Reads the rollup table, so the cost is O(factories x months) rather than O(incidents)
+  query = (
+    db.query(
+      FactoryRiskRollup.factory_id,
+      Factory.name,
+      func.sum(FactoryRiskRollup.incidentCount),
+      func.sum(FactoryRiskRollup.threatLevelSum),
+      func.max(FactoryRiskRollup.threatLevelMax),
+      func.sum(FactoryRiskRollup.riskScore),
+    )
+    .join(Factory, Factory.id == FactoryRiskRollup.factory_id)
+  )
+  rows = (
+    filterRiskRollup(query, monthFrom, monthTo, factory_id)
+    .group_by(FactoryRiskRollup.factory_id, Factory.name)
+    .order_by(FactoryRiskRollup.factory_id)
+    .all()
+  )
+
+  return FactoryRiskIndexes(factories=[
+    FactoryRiskIndex(
+      factory_id=factory_id,
+      factory=factoryName,
+      incidentCount=incidentCount,
+      threatLevelSum=threatLevelSum,
+      threatLevelMax=threatLevelMax,
+      riskScore=riskScore,
+      riskIndex=riskScore / incidentCount if incidentCount else 0.0
+    )
+    for factory_id, factoryName, incidentCount, threatLevelSum, threatLevelMax, riskScore in rows
+  ])
+
+@router.get("/riskIndex/monthly", response_model=FactoryMonthlyRisks)
+def getMonthlyRiskIndex(
+  monthFrom: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+  monthTo: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+  factory_id: Optional[int] = None,
+  db: Session = Depends(get_db)
+):
+  query = db.query(FactoryRiskRollup, Factory.name).join(Factory, Factory.id == FactoryRiskRollup.factory_id)
+  rows = (
+    filterRiskRollup(query, monthFrom, monthTo, factory_id)
+    .order_by(FactoryRiskRollup.month, FactoryRiskRollup.factory_id)
+    .all()
+  )
+
+  return FactoryMonthlyRisks(months=[
+    FactoryMonthlyRisk(
+      factory_id=rollup.factory_id,
+      factory=factoryName,
+      month=rollup.month,
+      incidentCount=rollup.incidentCount,
+      threatLevelSum=rollup.threatLevelSum,
+      threatLevelMax=rollup.threatLevelMax,
+      riskScore=rollup.riskScore
+    )
+    for rollup, factoryName in rows
+  ])
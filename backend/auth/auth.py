@@ -1,40 +1,44 @@
-import os
 import re
 
-from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 from fastapi import Depends, HTTPException, status, APIRouter
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from .auth_db import get_db, User
 from .auth_model import CreateUser, Token
+from .auth_settings import getAuthSettings
+from .password_hashing import passwordHasher
+from .token_cache import tokenCache
 
 router = APIRouter(prefix="/auth")
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-load_dotenv()
-
 @router.post("/user", status_code=status.HTTP_201_CREATED)
 async def createUser(user: CreateUser, db: Session = Depends(get_db)):
-  validateUsername(user.username, db)
-  validatePassword(user.password, db)
+  # database work runs on the threadpool, as it would for a sync endpoint
+  await run_in_threadpool(validateUsername, user.username, db)
+  await run_in_threadpool(validatePassword, user.password, db)
 
-  # hash password
-  hashedPassword = bcrypt_context.hash(user.password)
+  # hash password on the bcrypt pool rather than the event loop
+  hashedPassword = await passwordHasher.hash(user.password)
 
   # create user
-  newUser = User(username=user.username, hashed_password=hashedPassword)
+  await run_in_threadpool(saveUser, User(username=user.username, hashed_password=hashedPassword), db)
+
+  return status.HTTP_201_CREATED
+
+def saveUser(newUser: User, db: Session):
   db.add(newUser)
   db.commit()
   db.refresh(newUser)
 
-  return status.HTTP_201_CREATED
+def findUser(username: str, db: Session):
+  return db.query(User).filter(User.username == username).first()
 
 def validateUsername(username: str, db: Session):
   if len(username) < 5:
@@ -44,7 +48,7 @@ def validateUsername(username: str, db: Session):
     raise HTTPException(status_code=400, detail="Username can only contain letters, numbers, and underscores")
 
   # check username is unique
-  existingUser = db.query(User).filter(User.username == username).first()
+  existingUser = findUser(username, db)
   if existingUser:
     raise HTTPException(status_code=400, detail="Username already exists")
 
@@ -69,23 +73,22 @@ def validatePassword(password: str, db: Session):
 
   return True
 
-def authenticateUser(username: str, password: str, db: Session = Depends(get_db)):
-  user = db.query(User).filter(User.username == username).first()
+async def authenticateUser(username: str, password: str, db: Session) -> bool:
+  # Lookup on the threadpool, bcrypt verify on the bcrypt pool: neither blocks the event loop
+  user = await run_in_threadpool(findUser, username, db)
   if not user:
     return False
-  if not bcrypt_context.verify(password, user.hashed_password):
-    return False
-  return True
+  return await passwordHasher.verify(password, user.hashed_password)
 
 def createAccessToken(username: str):
-  expire = datetime.now(timezone.utc) + timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")))
+  settings = getAuthSettings()
+  expire = datetime.now(timezone.utc) + timedelta(minutes=settings.accessTokenExpireMinutes)
   encode = {"sub": username, "exp": expire}
-  return jwt.encode(encode, str(os.getenv("AUTH_KEY")), algorithm=os.getenv("ALGORITHM"))
+  return jwt.encode(encode, settings.secretKey, algorithm=settings.algorithm)
 
 @router.post("/token", response_model=Token)
-def loginForAccessToken(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)):
-  user = authenticateUser(form_data.username, form_data.password, db)
-  if not user:
+async def loginForAccessToken(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)):
+  if not await authenticateUser(form_data.username, form_data.password, db):
     raise HTTPException(status_code=401, detail="Invalid username or password")
 
   token = createAccessToken(form_data.username)
@@ -94,11 +97,22 @@ def loginForAccessToken(form_data: Annotated[OAuth2PasswordRequestForm, Depends(
 
 
 def getCurrentUser(token: Annotated[str, Depends(oauth2_bearer)]):
+  # Dashboards poll with the same token, so skip the signature check for ones already verified
+  user = tokenCache.get(token)
+  if user is not None:
+    return dict(user)
+
+  settings = getAuthSettings()
   try:
-    payload = jwt.decode(token, str(os.getenv("AUTH_KEY")), algorithms=[os.getenv("ALGORITHM")])
+    payload = jwt.decode(token, settings.secretKey, algorithms=[settings.algorithm])
     username: str = payload.get("sub")
     if not username: # Null or empty
       raise HTTPException(status_code=401, detail="Could not validate credentials")
-    return { "username": username }
   except JWTError:
     raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+  user = { "username": username }
+  # Tokens without an expiry are verified every time
+  if payload.get("exp") is not None:
+    tokenCache.put(token, user, payload["exp"])
+  return dict(user)
@@ -0,0 +1,41 @@
+import os
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from .token_cache import tokenCache
+
+load_dotenv()
+
+class AuthSettings(BaseModel):
+  secretKey: str
+  algorithm: str
+  accessTokenExpireMinutes: int
+  # Verified bearer tokens kept in memory, see token_cache.py
+  tokenCacheSize: int = 1024
+
+  class Config:
+    frozen = True
+
+def loadAuthSettings() -> AuthSettings:
+  return AuthSettings(
+    secretKey=os.getenv("AUTH_KEY"),
+    algorithm=os.getenv("ALGORITHM"),
+    accessTokenExpireMinutes=os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"),
+    tokenCacheSize=os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"),
+  )
+
+authSettings = None
+
+def getAuthSettings() -> AuthSettings:
+  """Settings read from the environment on first use (at the latest in the app lifespan)."""
+  if authSettings is None:
+    return reloadAuthSettings()
+  return authSettings
+
+def reloadAuthSettings() -> AuthSettings:
+  """Re-read the environment. Tokens verified with the old key are dropped from the cache."""
+  global authSettings
+  authSettings = loadAuthSettings()
+  tokenCache.configure(authSettings.tokenCacheSize)
+  return authSettings
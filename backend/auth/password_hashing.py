@@ -0,0 +1,87 @@
+import asyncio
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# bcrypt cost factor; each +1 doubles the time per hash. Existing hashes keep verifying at their own cost.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so one thread per core hashes in parallel without starving the event loop
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashes allowed to wait for a worker before new ones are rejected with 503
+BCRYPT_MAX_QUEUE = int(os.getenv("BCRYPT_MAX_QUEUE", "64"))
+
+bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class PasswordHasher:
+  """
+  Runs bcrypt on a dedicated, size-limited thread pool so hashing neither blocks
+  the event loop nor takes threads from the pool that serves sync endpoints.
+  Work beyond maxWorkers + maxQueue outstanding calls is shed with a 503.
+  """
+
+  def __init__(self, context: CryptContext, maxWorkers: int, maxQueue: int):
+    self.context = context
+    self.maxWorkers = maxWorkers
+    self.maxQueue = maxQueue
+    self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="bcrypt")
+    self.lock = threading.Lock()
+    self.submitted = 0
+    self.running = 0
+    self.completed = 0
+    self.rejected = 0
+    self.peakQueueDepth = 0
+    self.totalWaitSeconds = 0.0
+    self.totalRunSeconds = 0.0
+
+  def queueDepth(self) -> int:
+    return self.submitted - self.completed - self.running
+
+  async def run(self, function, *args):
+    with self.lock:
+      if self.submitted - self.completed >= self.maxWorkers + self.maxQueue:
+        self.rejected += 1
+        raise HTTPException(status_code=503, detail="Too many password checks in progress", headers={"Retry-After": "1"})
+      self.submitted += 1
+      self.peakQueueDepth = max(self.peakQueueDepth, self.queueDepth())
+    queuedAt = time.monotonic()
+    return await asyncio.get_running_loop().run_in_executor(self.executor, self.measure, queuedAt, function, *args)
+
+  def measure(self, queuedAt: float, function, *args):
+    startedAt = time.monotonic()
+    with self.lock:
+      self.running += 1
+      self.totalWaitSeconds += startedAt - queuedAt
+    try:
+      return function(*args)
+    finally:
+      with self.lock:
+        self.running -= 1
+        self.completed += 1
+        self.totalRunSeconds += time.monotonic() - startedAt
+
+  async def hash(self, password: str) -> str:
+    return await self.run(self.context.hash, password)
+
+  async def verify(self, password: str, hashedPassword: str) -> bool:
+    return await self.run(self.context.verify, password, hashedPassword)
+
+  def stats(self) -> dict:
+    with self.lock:
+      return {
+        "rounds": BCRYPT_ROUNDS,
+        "maxWorkers": self.maxWorkers,
+        "maxQueue": self.maxQueue,
+        "running": self.running,
+        "queueDepth": self.queueDepth(),
+        "peakQueueDepth": self.peakQueueDepth,
+        "completed": self.completed,
+        "rejected": self.rejected,
+        "averageWaitMs": self.totalWaitSeconds / self.completed * 1000 if self.completed else 0.0,
+        "averageRunMs": self.totalRunSeconds / self.completed * 1000 if self.completed else 0.0,
+      }
+
+passwordHasher = PasswordHasher(bcrypt_context, BCRYPT_MAX_WORKERS, BCRYPT_MAX_QUEUE)
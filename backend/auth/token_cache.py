@@ -0,0 +1,90 @@
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+
+from metrics import recordCacheLookup
+
+class VerifiedTokenCache:
+  """
+  Bounded LRU of bearer tokens whose signature and claims were already verified,
+  keyed by the token's sha256 digest so raw tokens are not kept in memory.
+  An entry is dropped at the token's `exp` claim, so a cached token is never
+  accepted after jwt.decode would have rejected it.
+  """
+
+  def __init__(self, maxSize: int = 1024):
+    self.lock = threading.Lock()
+    self.maxSize = maxSize
+    # digest -> (exp timestamp, user)
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.expirations = 0
+    self.evictions = 0
+
+  @staticmethod
+  def digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+  def get(self, token: str):
+    key = self.digest(token)
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        self.misses += 1
+        recordCacheLookup("token", False)
+        return None
+      exp, user = entry
+      if exp <= time.time():
+        del self.entries[key]
+        self.expirations += 1
+        self.misses += 1
+        recordCacheLookup("token", False)
+        return None
+      self.entries.move_to_end(key)
+      self.hits += 1
+      recordCacheLookup("token", True)
+      return user
+
+  def put(self, token: str, user: dict, exp: float):
+    if self.maxSize <= 0 or exp <= time.time():
+      return
+    key = self.digest(token)
+    with self.lock:
+      self.entries[key] = (exp, user)
+      self.entries.move_to_end(key)
+      if len(self.entries) > self.maxSize:
+        # Drop expired tokens before evicting live ones
+        self.removeExpired()
+      while len(self.entries) > self.maxSize:
+        self.entries.popitem(last=False)
+        self.evictions += 1
+
+  def removeExpired(self):
+    now = time.time()
+    for key in [key for key, (exp, _) in self.entries.items() if exp <= now]:
+      del self.entries[key]
+      self.expirations += 1
+
+  def configure(self, maxSize: int):
+    """Resize and empty the cache, e.g. after the signing key changed."""
+    with self.lock:
+      self.maxSize = maxSize
+      self.entries.clear()
+
+  def stats(self) -> dict:
+    with self.lock:
+      lookups = self.hits + self.misses
+      return {
+        "size": len(self.entries),
+        "maxSize": self.maxSize,
+        "hits": self.hits,
+        "misses": self.misses,
+        "expirations": self.expirations,
+        "evictions": self.evictions,
+        "hitRatio": self.hits / lookups if lookups else 0.0,
+      }
+
+tokenCache = VerifiedTokenCache()
@@ -0,0 +1,258 @@
+"""
+Latency, throughput and memory of the API hot paths on a synthetic dataset.
+
+Generates a dataset with synthetic_data.py (or reuses the one already in
+--dataDirectory), then sends each scenario's requests from --concurrency
+concurrent clients, either in-process through the ASGI interface (httpx
+ASGITransport, no sockets) or over HTTP to a uvicorn worker. Prints
+p50/p95/p99 latency and requests per second for each scenario, plus the peak
+RSS of the process serving the app, as JSON.
+
+The app always runs in a fresh process started from --backend, so another
+checkout can be measured against the same dataset:
+
+  python benchmarks/api_hot_paths.py --incidents 100000
+  python benchmarks/api_hot_paths.py --dataDirectory /tmp/bench --mode http --concurrency 16
+  python benchmarks/api_hot_paths.py --dataDirectory /tmp/bench --backend /path/to/other/checkout/backend
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PASSWORD = "Benchmark1!"
+benchmarksDir = os.path.dirname(os.path.abspath(__file__))
+
+def percentiles(samples: list[float]) -> dict:
+  samples = sorted(samples)
+  def at(fraction):
+    return round(samples[min(len(samples) - 1, int(len(samples) * fraction))], 2)
+  return {
+    "count": len(samples),
+    "p50Ms": at(0.50),
+    "p95Ms": at(0.95),
+    "p99Ms": at(0.99),
+    "maxMs": round(samples[-1], 2),
+  }
+
+def freePort() -> int:
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+async def prepare(client: httpx.AsyncClient) -> dict:
+  """Look up the ids the scenarios draw from and make sure the benchmark user exists."""
+  async def ids(path: str, key: str) -> list[int]:
+    response = await client.get(path)
+    response.raise_for_status()
+    return [item["id"] for item in response.json()[key]]
+
+  response = await client.post("/auth/user", json={"username": "benchuser", "password": PASSWORD})
+  # 400: the user is left over from an earlier run on the same dataset
+  if response.status_code not in (201, 400):
+    response.raise_for_status()
+  return {
+    "factoryIds": await ids("/factories", "factories"),
+    "workerIds": await ids("/workers", "workers"),
+    "threatTypeIds": await ids("/threatTypes", "threatTypes"),
+    "workTypeIds": await ids("/workTypes", "workTypes"),
+    "industryTypeLargeIds": await ids("/industryTypes/large", "industryTypeLarge"),
+    "industryTypeMediumIds": await ids("/industryTypes/medium", "industryTypeMedium"),
+    "checkQuestionIds": await ids("/checks", "checks"),
+  }
+
+def scenarios(context: dict, rng: random.Random, args) -> dict:
+  """Scenario name -> (request count, function sending one request)."""
+  def newIncident() -> dict:
+    return {
+      "worker_id": rng.choice(context["workerIds"]),
+      "industryTypeLarge_id": rng.choice(context["industryTypeLargeIds"]),
+      "industryTypeMedium_id": rng.choice(context["industryTypeMediumIds"]),
+      "threatType_id": rng.choice(context["threatTypeIds"]),
+      "threatLevel": rng.randint(1, 5),
+      "workType_id": rng.choice(context["workTypeIds"]),
+      "description": "benchmark incident",
+      "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "factory_id": rng.choice(context["factoryIds"]),
+      "check_responses": {str(questionId): rng.random() < 0.7 for questionId in context["checkQuestionIds"]},
+    }
+
+  return {
+    "GET /incidents": (args.requests, lambda client: client.get("/incidents")),
+    "GET /incidents/factory/{id}": (args.requests, lambda client: client.get(f"/incidents/factory/{rng.choice(context['factoryIds'])}")),
+    "GET /factories": (args.requests, lambda client: client.get("/factories")),
+    "GET /workers": (args.requests, lambda client: client.get("/workers")),
+    "POST /incidents": (args.requests, lambda client: client.post("/incidents", json=newIncident())),
+    # bcrypt makes logins orders of magnitude slower than the other scenarios
+    "POST /auth/token": (args.authRequests, lambda client: client.post("/auth/token", data={"username": "benchuser", "password": PASSWORD})),
+  }
+
+async def measure(client: httpx.AsyncClient, send, requests: int, concurrency: int, warmup: int) -> dict:
+  for _ in range(warmup):
+    (await send(client)).raise_for_status()
+
+  latencies = []
+  remaining = iter(range(requests))
+  async def runClient():
+    # The clients share one iterator, so `requests` are sent in total
+    for _ in remaining:
+      started = time.perf_counter()
+      response = await send(client)
+      response.raise_for_status()
+      latencies.append((time.perf_counter() - started) * 1000)
+
+  started = time.perf_counter()
+  await asyncio.gather(*[runClient() for _ in range(concurrency)])
+  elapsed = time.perf_counter() - started
+  return {**percentiles(latencies), "requestsPerSecond": round(requests / elapsed, 1)}
+
+async def runScenarios(client: httpx.AsyncClient, args) -> dict:
+  context = await prepare(client)
+  rng = random.Random(args.seed)
+  return {
+    name: await measure(client, send, count, args.concurrency, args.warmup)
+    for name, (count, send) in scenarios(context, rng, args).items()
+    if name in args.scenarios
+  }
+
+def peakRssMb(pid: int) -> float:
+  # VmHWM is the resident set high-water mark of a live process (Linux)
+  with open(f"/proc/{pid}/status") as status:
+    for line in status:
+      if line.startswith("VmHWM:"):
+        return round(int(line.split()[1]) / 1024, 1)
+  return None
+
+async def serveInProcess(args) -> dict:
+  """Runs in the child process started by runInProcess, with the working directory set to --backend."""
+  sys.path.insert(0, os.getcwd())
+  from main import app
+
+  async with app.router.lifespan_context(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+      results = await runScenarios(client, args)
+  # ru_maxrss is in KiB on Linux
+  return {"scenarios": results, "peakRssMb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+def runInProcess(args, env: dict) -> dict:
+  process = subprocess.run(
+    [sys.executable, os.path.abspath(__file__), "--serveInProcess", *sys.argv[1:]],
+    cwd=args.backend, env=env, stdout=subprocess.PIPE, text=True, check=True
+  )
+  # The app may print (e.g. migrations) before the results, which are the last line
+  return json.loads(process.stdout.strip().splitlines()[-1])
+
+async def waitForServer(client: httpx.AsyncClient, process):
+  for _ in range(600):
+    if process.poll() is not None:
+      raise RuntimeError("server exited during start-up")
+    try:
+      await client.get("/workTypes")
+      return
+    except httpx.TransportError:
+      await asyncio.sleep(0.05)
+  raise RuntimeError("server did not start")
+
+def runOverHttp(args, env: dict) -> dict:
+  port = freePort()
+  process = subprocess.Popen(
+    [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+    cwd=args.backend, env=env, stdout=subprocess.DEVNULL
+  )
+
+  async def run():
+    limits = httpx.Limits(max_connections=args.concurrency + 2)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits) as client:
+      await waitForServer(client, process)
+      return await runScenarios(client, args)
+
+  try:
+    results = asyncio.run(run())
+    return {"scenarios": results, "peakRssMb": peakRssMb(process.pid)}
+  finally:
+    process.terminate()
+    process.wait()
+
+def ensureDataset(args, env: dict) -> bool:
+  """Generate the dataset unless --dataDirectory already holds one. Returns whether it was generated."""
+  if os.path.exists(os.path.join(args.dataDirectory, "database.db")):
+    return False
+  os.makedirs(args.dataDirectory, exist_ok=True)
+  subprocess.run(
+    [
+      sys.executable, os.path.join(benchmarksDir, "synthetic_data.py"),
+      "--factories", str(args.factories), "--workers", str(args.workers),
+      "--incidents", str(args.incidents), "--seed", str(args.seed),
+    ],
+    env=env, stdout=sys.stderr, check=True
+  )
+  return True
+
+def datasetCounts(dataDirectory: str) -> dict:
+  """Row counts of the dataset as it is, which for a reused directory may differ from the arguments."""
+  connection = sqlite3.connect(os.path.join(dataDirectory, "database.db"))
+  try:
+    return {
+      name: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+      for name, table in [("factories", "factory"), ("workers", "worker"), ("incidents", "incident")]
+    }
+  finally:
+    connection.close()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--mode", choices=["inprocess", "http", "both"], default="both")
+  parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+  parser.add_argument("--authRequests", type=int, default=20, help="requests for POST /auth/token")
+  parser.add_argument("--concurrency", type=int, default=8)
+  parser.add_argument("--warmup", type=int, default=5, help="untimed requests before each scenario")
+  parser.add_argument("--scenarios", nargs="+", default=["GET /incidents", "GET /incidents/factory/{id}", "GET /factories", "GET /workers", "POST /incidents", "POST /auth/token"])
+  parser.add_argument("--dataDirectory", help="holds database.db and user.db; reused if present (default: a temporary directory)")
+  parser.add_argument("--factories", type=int, default=40)
+  parser.add_argument("--workers", type=int, default=5000)
+  parser.add_argument("--incidents", type=int, default=10000)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--backend", default=os.path.abspath(os.path.join(benchmarksDir, "..")))
+  parser.add_argument("--serveInProcess", action="store_true", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.serveInProcess:
+    print(json.dumps(asyncio.run(serveInProcess(args))))
+    sys.exit()
+
+  with tempfile.TemporaryDirectory() as directory:
+    args.dataDirectory = os.path.abspath(args.dataDirectory or directory)
+    env = {
+      **os.environ,
+      "DATABASE_URL": f"sqlite:///{args.dataDirectory}/database.db",
+      "AUTH_DATABASE_URL": f"sqlite:///{args.dataDirectory}/user.db",
+      "AUTH_KEY": os.getenv("AUTH_KEY", "benchmark"),
+      "ALGORITHM": os.getenv("ALGORITHM", "HS256"),
+      "ACCESS_TOKEN_EXPIRE_MINUTES": os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"),
+      "LOG_DIR": os.path.join(directory, "logs"),
+    }
+    generated = ensureDataset(args, env)
+
+    report = {
+      "backend": args.backend,
+      # The seed is only known for a dataset generated by this run
+      "dataset": {"directory": args.dataDirectory, "generated": generated, **datasetCounts(args.dataDirectory), "seed": args.seed if generated else None},
+      "concurrency": args.concurrency,
+    }
+    if args.mode in ("inprocess", "both"):
+      report["inProcess"] = runInProcess(args, env)
+    if args.mode in ("http", "both"):
+      report["http"] = runOverHttp(args, env)
+
+  print(json.dumps(report, indent=2))
@@ -0,0 +1,189 @@
+"""
+Idle subscribers per worker and fan-out latency of the live incident feed.
+
+Starts one uvicorn worker on a synthetic dataset (see synthetic_data.py; reused
+if --dataDirectory already holds one) and opens --subscribers concurrent
+GET /incidents/live streams, each watching one factory or, for
+--allFactoriesShare of them, every factory. The streams are plain asyncio
+sockets reading lines, so the client stays cheap. Then --incidents incidents
+are posted one at a time, and the time from sending each POST to the event
+reaching every interested subscriber is recorded.
+
+Prints as JSON:
+  - the server's RSS before and after the subscribers connected, and per subscriber
+  - how long connecting took
+  - POST /incidents latency with the subscribers attached and after they left
+  - delivery latency percentiles, and how many events were missing
+
+  python benchmarks/live_feed_load.py --subscribers 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from api_hot_paths import ensureDataset, freePort, percentiles, waitForServer
+
+benchmarksDir = os.path.dirname(os.path.abspath(__file__))
+
+def rssMb(pid: int) -> float:
+  with open(f"/proc/{pid}/status") as status:
+    for line in status:
+      if line.startswith("VmRSS:"):
+        return round(int(line.split()[1]) / 1024, 1)
+  return None
+
+class LiveSubscriber:
+  def __init__(self, factoryId):
+    self.factoryId = factoryId
+    # incident id -> perf_counter when its event arrived
+    self.received = {}
+
+  async def connect(self, port: int):
+    self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+    query = f"?factory_id={self.factoryId}" if self.factoryId is not None else ""
+    self.writer.write(f"GET /incidents/live{query} HTTP/1.1\r\nHost: benchmark\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await self.writer.drain()
+    # Connected once the retry field of the stream arrived
+    while not (await self.reader.readline()).startswith(b"retry:"):
+      pass
+
+  async def listen(self):
+    # The body is chunked; every event is written as one chunk, so its data line arrives whole
+    while True:
+      line = await self.reader.readline()
+      if not line:
+        return
+      if line.startswith(b"data: "):
+        self.received[json.loads(line[6:])["id"]] = time.perf_counter()
+
+  def close(self):
+    self.writer.close()
+
+async def timedPosts(client: httpx.AsyncClient, incidents: list[dict]) -> tuple[list[float], dict]:
+  """POST each incident in turn; returns the latencies and incident id -> (factory id, perf_counter when it was sent)."""
+  latencies = []
+  sent = {}
+  for incident in incidents:
+    started = time.perf_counter()
+    response = await client.post("/incidents", json=incident)
+    response.raise_for_status()
+    finished = time.perf_counter()
+    sent[response.json()["id"]] = (incident["factory_id"], started)
+    latencies.append((finished - started) * 1000)
+    # Leave the server a moment, as reports trickle in during a shift
+    await asyncio.sleep(0.01)
+  return latencies, sent
+
+async def run(args, port: int, serverProcess) -> dict:
+  rng = random.Random(args.seed)
+  async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+    await waitForServer(client, serverProcess)
+    referenceData = (await client.get("/referenceData")).json()
+    factoryIds = [factory["id"] for factory in referenceData["factories"]]
+    workerIds = [worker["id"] for worker in (await client.get("/workers")).json()["workers"][:100]]
+
+    def newIncident() -> dict:
+      return {
+        "worker_id": rng.choice(workerIds),
+        "industryTypeLarge_id": rng.choice(referenceData["industryTypeLarge"])["id"],
+        "industryTypeMedium_id": rng.choice(referenceData["industryTypeMedium"])["id"],
+        "threatType_id": rng.choice(referenceData["threatTypes"])["id"],
+        "threatLevel": rng.randint(1, 5),
+        "workType_id": rng.choice(referenceData["workTypes"])["id"],
+        "description": "live feed benchmark",
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "factory_id": rng.choice(factoryIds),
+      }
+
+    rssBefore = rssMb(serverProcess.pid)
+    subscribers = [
+      LiveSubscriber(None if rng.random() < args.allFactoriesShare else rng.choice(factoryIds))
+      for _ in range(args.subscribers)
+    ]
+    started = time.perf_counter()
+    # In batches, to stay within the listen backlog
+    for start in range(0, len(subscribers), 200):
+      await asyncio.gather(*[subscriber.connect(port) for subscriber in subscribers[start:start + 200]])
+    connectSeconds = time.perf_counter() - started
+    await asyncio.sleep(1)
+    rssAfter = rssMb(serverProcess.pid)
+
+    listeners = [asyncio.create_task(subscriber.listen()) for subscriber in subscribers]
+    incidents = [newIncident() for _ in range(args.incidents)]
+    postLatencies, sent = await timedPosts(client, incidents)
+    await asyncio.sleep(1)
+
+    deliveryMs = []
+    missing = 0
+    for subscriber in subscribers:
+      for incidentId, (factoryId, sentAt) in sent.items():
+        if subscriber.factoryId not in (None, factoryId):
+          continue
+        if incidentId in subscriber.received:
+          deliveryMs.append((subscriber.received[incidentId] - sentAt) * 1000)
+        else:
+          missing += 1
+
+    for listener in listeners:
+      listener.cancel()
+    for subscriber in subscribers:
+      subscriber.close()
+    # Let the server finish tearing the streams down
+    await asyncio.sleep(5)
+    baselineLatencies, _ = await timedPosts(client, [newIncident() for _ in range(args.incidents)])
+
+  return {
+    "subscribers": args.subscribers,
+    "connectSeconds": round(connectSeconds, 2),
+    "serverRssMb": {"before": rssBefore, "withSubscribers": rssAfter, "perSubscriberKb": round((rssAfter - rssBefore) * 1024 / args.subscribers, 1)},
+    "postIncident": {"withSubscribers": percentiles(postLatencies), "withoutSubscribers": percentiles(baselineLatencies)},
+    # From sending the POST to the event arriving
+    "deliveryMs": {**percentiles(deliveryMs), "missing": missing} if deliveryMs else {"missing": missing},
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--subscribers", type=int, default=2000)
+  parser.add_argument("--allFactoriesShare", type=float, default=0.1, help="share of subscribers watching every factory")
+  parser.add_argument("--incidents", type=int, default=50, help="incidents posted while the subscribers listen")
+  parser.add_argument("--dataDirectory", help="holds database.db and user.db; reused if present (default: a temporary directory)")
+  parser.add_argument("--factories", type=int, default=40)
+  parser.add_argument("--workers", type=int, default=1000)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--backend", default=os.path.abspath(os.path.join(benchmarksDir, "..")))
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as directory:
+    args.dataDirectory = os.path.abspath(args.dataDirectory or directory)
+    env = {
+      **os.environ,
+      "DATABASE_URL": f"sqlite:///{args.dataDirectory}/database.db",
+      "AUTH_DATABASE_URL": f"sqlite:///{args.dataDirectory}/user.db",
+      "AUTH_KEY": os.getenv("AUTH_KEY", "benchmark"),
+      "ALGORITHM": os.getenv("ALGORITHM", "HS256"),
+      "ACCESS_TOKEN_EXPIRE_MINUTES": os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"),
+      "LOG_DIR": os.path.join(directory, "logs"),
+    }
+    # A small dataset is enough: the feed never reads existing incidents
+    ensureDataset(argparse.Namespace(**{**vars(args), "incidents": 1000}), env)
+
+    port = freePort()
+    serverProcess = subprocess.Popen(
+      [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning", "--backlog", "4096"],
+      cwd=args.backend, env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+      report = asyncio.run(run(args, port, serverProcess))
+    finally:
+      serverProcess.terminate()
+      serverProcess.wait()
+
+  print(json.dumps(report, indent=2))
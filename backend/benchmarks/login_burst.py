@@ -0,0 +1,136 @@
+"""
+Latency of an unrelated endpoint while the server handles a burst of logins.
+
+Starts the app under uvicorn against throwaway databases, creates one user,
+then probes GET /workTypes at a steady rate, first alone and then while
+--logins concurrent logins (and --signups signups) run. Prints probe latency
+percentiles for both phases and the login throughput as JSON.
+
+  python benchmarks/login_burst.py --logins 40 --signups 10
+  python benchmarks/login_burst.py --backend /path/to/other/checkout/backend
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PASSWORD = "Benchmark1!"
+
+def percentiles(samples: list[float]) -> dict:
+  samples = sorted(samples)
+  def at(fraction):
+    return round(samples[min(len(samples) - 1, int(len(samples) * fraction))], 1)
+  return {
+    "count": len(samples),
+    "p50Ms": at(0.50),
+    "p95Ms": at(0.95),
+    "p99Ms": at(0.99),
+    "maxMs": round(samples[-1], 1),
+  }
+
+def freePort() -> int:
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+async def waitForServer(client: httpx.AsyncClient, process):
+  for _ in range(200):
+    if process.poll() is not None:
+      raise RuntimeError("server exited during start-up")
+    try:
+      await client.get("/workTypes")
+      return
+    except httpx.TransportError:
+      await asyncio.sleep(0.05)
+  raise RuntimeError("server did not start")
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, interval: float) -> list[float]:
+  latencies = []
+  while not stop.is_set():
+    started = time.perf_counter()
+    response = await client.get("/workTypes")
+    response.raise_for_status()
+    latencies.append((time.perf_counter() - started) * 1000)
+    await asyncio.sleep(interval)
+  return latencies
+
+async def login(client: httpx.AsyncClient) -> float:
+  started = time.perf_counter()
+  response = await client.post("/auth/token", data={"username": "benchuser", "password": PASSWORD})
+  response.raise_for_status()
+  return (time.perf_counter() - started) * 1000
+
+async def signup(client: httpx.AsyncClient, index: int) -> float:
+  started = time.perf_counter()
+  response = await client.post("/auth/user", json={"username": f"benchuser{index}", "password": PASSWORD})
+  response.raise_for_status()
+  return (time.perf_counter() - started) * 1000
+
+async def run(baseUrl: str, process, args) -> dict:
+  limits = httpx.Limits(max_connections=args.logins + args.signups + 10)
+  async with httpx.AsyncClient(base_url=baseUrl, timeout=120, limits=limits) as client:
+    await waitForServer(client, process)
+    (await client.post("/auth/user", json={"username": "benchuser", "password": PASSWORD})).raise_for_status()
+
+    stop = asyncio.Event()
+    idleProbe = asyncio.create_task(probe(client, stop, args.interval))
+    await asyncio.sleep(args.idleSeconds)
+    stop.set()
+    idle = await idleProbe
+
+    stop = asyncio.Event()
+    burstProbe = asyncio.create_task(probe(client, stop, args.interval))
+    started = time.perf_counter()
+    logins = await asyncio.gather(
+      *[login(client) for _ in range(args.logins)],
+      *[signup(client, index) for index in range(args.signups)]
+    )
+    burstSeconds = time.perf_counter() - started
+    stop.set()
+    burst = await burstProbe
+
+  return {
+    "probeIdle": percentiles(idle),
+    "probeDuringBurst": percentiles(burst),
+    "authRequests": percentiles(logins),
+    "authRequestsPerSecond": round(len(logins) / burstSeconds, 2),
+    "burstSeconds": round(burstSeconds, 2),
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--logins", type=int, default=40)
+  parser.add_argument("--signups", type=int, default=10)
+  parser.add_argument("--interval", type=float, default=0.01, help="seconds between probes")
+  parser.add_argument("--idleSeconds", type=float, default=2)
+  parser.add_argument("--backend", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as directory:
+    port = freePort()
+    env = {
+      **os.environ,
+      "DATABASE_URL": f"sqlite:///{directory}/database.db",
+      "AUTH_DATABASE_URL": f"sqlite:///{directory}/user.db",
+      "AUTH_KEY": os.getenv("AUTH_KEY", "benchmark"),
+      "ALGORITHM": os.getenv("ALGORITHM", "HS256"),
+      "ACCESS_TOKEN_EXPIRE_MINUTES": os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"),
+    }
+    process = subprocess.Popen(
+      [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+      cwd=args.backend, env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+      results = asyncio.run(run(f"http://127.0.0.1:{port}", process, args))
+    finally:
+      process.terminate()
+      process.wait()
+
+  print(json.dumps({"backend": args.backend, "logins": args.logins, "signups": args.signups, **results}, indent=2))
@@ -0,0 +1,99 @@
+"""
+Request throughput with and without the request logging middleware.
+
+Drives a minimal FastAPI app in-process through the ASGI interface (no
+sockets) with: no middleware, the previous BaseHTTPMiddleware version that
+wrote two lines per request through a plain FileHandler, and the current pure
+ASGI middleware logging through the queue. Prints requests per second for a
+JSON endpoint and a streaming endpoint as JSON.
+
+  python benchmarks/middleware_overhead.py --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+logDirectory = tempfile.mkdtemp()
+os.environ["LOG_DIR"] = logDirectory
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from logging_middleware import LoggingMiddleware
+
+previousLogger = logging.getLogger("benchmark.previous")
+previousLogger.propagate = False
+previousLogger.addHandler(logging.FileHandler(os.path.join(logDirectory, "previous.log")))
+previousLogger.setLevel(logging.INFO)
+
+class PreviousLoggingMiddleware(BaseHTTPMiddleware):
+  async def dispatch(self, request, call_next):
+    startTime = time.time()
+    method = request.method
+    path = request.url.path
+    previousLogger.info(f"Request: {method} {path}")
+    response = await call_next(request)
+    processingTime = time.time() - startTime
+    previousLogger.info(f"Response: {method} {path} - Status: {response.status_code} - Time: {processingTime:.4f}s")
+    return response
+
+def createApp(middleware) -> FastAPI:
+  app = FastAPI()
+
+  @app.get("/ping")
+  async def ping():
+    return {"ok": True}
+
+  @app.get("/stream")
+  async def stream():
+    return StreamingResponse((f"{i}\n" for i in range(20)), media_type="text/plain")
+
+  if middleware is not None:
+    app.add_middleware(middleware)
+  return app
+
+async def request(app, path: str):
+  scope = {
+    "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1", "method": "GET",
+    "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+    "headers": [(b"host", b"benchmark")], "client": ("127.0.0.1", 50000), "server": ("benchmark", 80),
+  }
+
+  async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+  async def send(message):
+    pass
+
+  await app(scope, receive, send)
+
+async def throughput(app, path: str, requests: int) -> float:
+  for _ in range(100):
+    await request(app, path)
+  started = time.perf_counter()
+  for _ in range(requests):
+    await request(app, path)
+  return round(requests / (time.perf_counter() - started), 1)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--requests", type=int, default=5000)
+  args = parser.parse_args()
+
+  variants = {"none": None, "previous": PreviousLoggingMiddleware, "current": LoggingMiddleware}
+  results = {}
+  for name, middleware in variants.items():
+    app = createApp(middleware)
+    results[name] = {
+      "jsonRequestsPerSecond": asyncio.run(throughput(app, "/ping", args.requests)),
+      "streamingRequestsPerSecond": asyncio.run(throughput(app, "/stream", args.requests)),
+    }
+  print(json.dumps({"requests": args.requests, "results": results}, indent=2))
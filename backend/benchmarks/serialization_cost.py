@@ -0,0 +1,103 @@
+"""
+CPU time and memory of serializing a large incident list response.
+
+Builds a synthetic dataset (see synthetic_data.py) in a temporary directory
+and loads --incidents incidents once. Each variant then turns them into the
+bytes of a GET /incidents response body:
+
+  responseModels  serializeIncidents into IncidentResponses, then FastAPI's own
+                  response_model validation/serialization and JSONResponse,
+                  as the endpoints did before
+  json            serializeIncidentDicts with the standard library encoder
+  orjson          serializeIncidentDicts with orjson (skipped if not installed)
+  compact         as the fastest of the above, with checkResponseFormat=compact
+
+Prints CPU milliseconds per response, the peak memory allocated while
+building one (tracemalloc) and the body size, plain and gzipped, as JSON.
+
+  python benchmarks/serialization_cost.py --incidents 10000 --runs 5
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+dataDirectory = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{dataDirectory}/database.db"
+os.environ["AUTH_DATABASE_URL"] = f"sqlite:///{dataDirectory}/user.db"
+os.environ["LOG_DIR"] = os.path.join(dataDirectory, "logs")
+os.environ.setdefault("AUTH_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+import serialization
+from db import Incident, SessionLocal
+from main import app
+from model import IncidentResponses
+from serialization import FastJSONResponse, incidentListContent, serializeIncidents
+from synthetic_data import generateDataset
+
+incidentsRoute = next(route for route in app.routes if getattr(route, "path", None) == "/incidents" and "GET" in route.methods)
+
+def responseModelsBody(incidents, db) -> bytes:
+  content = IncidentResponses(incidents=serializeIncidents(incidents, db), nextCursor=None)
+  encoded = asyncio.run(serialize_response(field=incidentsRoute.response_field, response_content=content, is_coroutine=True))
+  return JSONResponse(encoded).body
+
+def fastJsonBody(incidents, db) -> bytes:
+  return FastJSONResponse(incidentListContent(incidents, None, db)).body
+
+def compactBody(incidents, db) -> bytes:
+  return FastJSONResponse(incidentListContent(incidents, None, db, "compact")).body
+
+def measure(build, incidents, db, runs: int) -> dict:
+  body = build(incidents, db)
+  cpuMs = []
+  for _ in range(runs):
+    started = time.process_time()
+    build(incidents, db)
+    cpuMs.append((time.process_time() - started) * 1000)
+
+  tracemalloc.start()
+  build(incidents, db)
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return {
+    "cpuMsMedian": round(statistics.median(cpuMs), 1),
+    "cpuMsMin": round(min(cpuMs), 1),
+    "peakAllocatedMb": round(peak / 1024 / 1024, 2),
+    "bodyBytes": len(body),
+    "gzipBodyBytes": len(gzip.compress(body)),
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--incidents", type=int, default=10000)
+  parser.add_argument("--runs", type=int, default=5)
+  args = parser.parse_args()
+
+  generateDataset(factories=40, workers=2000, incidents=args.incidents)
+  orjson = serialization.orjson
+  results = {}
+  with SessionLocal() as db:
+    incidents = db.query(Incident).order_by(Incident.date.desc(), Incident.id.desc()).limit(args.incidents).all()
+    results["responseModels"] = measure(responseModelsBody, incidents, db, args.runs)
+    serialization.orjson = None
+    results["json"] = measure(fastJsonBody, incidents, db, args.runs)
+    serialization.orjson = orjson
+    if orjson is not None:
+      results["orjson"] = measure(fastJsonBody, incidents, db, args.runs)
+    results["compact"] = measure(compactBody, incidents, db, args.runs)
+
+  print(json.dumps({"incidents": len(incidents), "runs": args.runs, "results": results}, indent=2))
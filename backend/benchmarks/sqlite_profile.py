@@ -0,0 +1,109 @@
+"""
+Concurrent read/write throughput of the SQLite engine profiles.
+
+Runs the same mixed workload (indexed page reads plus single-row insert
+transactions) from several threads against a fresh database per profile and
+prints the results as JSON.
+
+  python benchmarks/sqlite_profile.py --clients 8 --seconds 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db_engine import createEngine, sqliteProfiles
+
+SEED_ROWS = 20000
+FACTORIES = 20
+
+def seed(engine):
+  with engine.begin() as connection:
+    connection.execute(text(
+      "CREATE TABLE incident (id INTEGER PRIMARY KEY, factory_id INTEGER, threatLevel INTEGER, description TEXT, date TEXT)"
+    ))
+    connection.execute(text("CREATE INDEX ix_incident_factory_date_id ON incident (factory_id, date, id)"))
+    connection.execute(
+      text("INSERT INTO incident (factory_id, threatLevel, description, date) VALUES (:factory_id, :threatLevel, :description, :date)"),
+      [
+        {"factory_id": i % FACTORIES, "threatLevel": i % 5 + 1, "description": "seed " * 20, "date": f"2025-{i % 12 + 1:02d}-01 00:00:{i % 60:02d}"}
+        for i in range(SEED_ROWS)
+      ]
+    )
+
+def percentile(values: list, fraction: float) -> float:
+  if not values:
+    return 0.0
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def runClient(engine, deadline: float, writeRatio: float, result: dict):
+  rng = random.Random()
+  while time.perf_counter() < deadline:
+    isWrite = rng.random() < writeRatio
+    start = time.perf_counter()
+    try:
+      with engine.begin() as connection:
+        if isWrite:
+          connection.execute(
+            text("INSERT INTO incident (factory_id, threatLevel, description, date) VALUES (:factory_id, 3, 'bench', '2025-06-01 00:00:00')"),
+            {"factory_id": rng.randrange(FACTORIES)}
+          )
+        else:
+          connection.execute(
+            text("SELECT * FROM incident WHERE factory_id = :factory_id ORDER BY date DESC, id DESC LIMIT 50"),
+            {"factory_id": rng.randrange(FACTORIES)}
+          ).fetchall()
+    except OperationalError:
+      result["errors"] += 1
+      continue
+    latency = time.perf_counter() - start
+    result["writeLatencies" if isWrite else "readLatencies"].append(latency)
+
+def benchmarkProfile(profile: str, clients: int, seconds: float, writeRatio: float) -> dict:
+  with tempfile.TemporaryDirectory() as directory:
+    engine = createEngine(f"sqlite:///{os.path.join(directory, 'bench.db')}", profile=profile)
+    seed(engine)
+    results = [{"readLatencies": [], "writeLatencies": [], "errors": 0} for _ in range(clients)]
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=runClient, args=(engine, deadline, writeRatio, result)) for result in results]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    engine.dispose()
+
+  reads = [latency for result in results for latency in result["readLatencies"]]
+  writes = [latency for result in results for latency in result["writeLatencies"]]
+  return {
+    "readsPerSecond": round(len(reads) / seconds, 1),
+    "writesPerSecond": round(len(writes) / seconds, 1),
+    "lockErrors": sum(result["errors"] for result in results),
+    "readP95Ms": round(percentile(reads, 0.95) * 1000, 3),
+    "writeP95Ms": round(percentile(writes, 0.95) * 1000, 3),
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--clients", type=int, default=8)
+  parser.add_argument("--seconds", type=float, default=5)
+  parser.add_argument("--write-ratio", type=float, default=0.2)
+  parser.add_argument("--profiles", nargs="+", default=list(sqliteProfiles))
+  args = parser.parse_args()
+
+  report = {
+    "clients": args.clients,
+    "seconds": args.seconds,
+    "writeRatio": args.write_ratio,
+    "profiles": {profile: benchmarkProfile(profile, args.clients, args.seconds, args.write_ratio) for profile in args.profiles},
+  }
+  print(json.dumps(report, indent=2))
@@ -0,0 +1,65 @@
+"""
+Worker start-up time: importing the models and running the app lifespan.
+
+Each measurement is a fresh interpreter, so it includes every import the
+process pays for. "firstStart" runs against an empty database, "restart"
+against one that an earlier start already created and seeded. Prints the
+median wall times in milliseconds as JSON.
+
+  python benchmarks/startup.py --runs 5
+  python benchmarks/startup.py --backend /path/to/other/checkout/backend
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+scripts = {
+  "importDb": "import db",
+  "startup": (
+    "import asyncio\n"
+    "from main import app\n"
+    "async def start():\n"
+    "  async with app.router.lifespan_context(app):\n"
+    "    pass\n"
+    "asyncio.run(start())\n"
+  ),
+}
+
+def timeScript(backend: str, script: str, env: dict) -> float:
+  started = time.perf_counter()
+  subprocess.run([sys.executable, "-c", script], cwd=backend, env=env, check=True, stdout=subprocess.DEVNULL)
+  return (time.perf_counter() - started) * 1000
+
+def measure(backend: str, runs: int) -> dict:
+  results = {}
+  for name, script in scripts.items():
+    firstStart, restart = [], []
+    for _ in range(runs):
+      with tempfile.TemporaryDirectory() as directory:
+        env = {
+          **os.environ,
+          "DATABASE_URL": f"sqlite:///{directory}/database.db",
+          "AUTH_DATABASE_URL": f"sqlite:///{directory}/user.db",
+          "AUTH_KEY": os.getenv("AUTH_KEY", "benchmark"),
+          "ALGORITHM": os.getenv("ALGORITHM", "HS256"),
+          "ACCESS_TOKEN_EXPIRE_MINUTES": os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"),
+        }
+        firstStart.append(timeScript(backend, script, env))
+        restart.append(timeScript(backend, script, env))
+    results[name] = {
+      "firstStartMs": round(statistics.median(firstStart), 1),
+      "restartMs": round(statistics.median(restart), 1),
+    }
+  return results
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--runs", type=int, default=5)
+  parser.add_argument("--backend", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+  args = parser.parse_args()
+  print(json.dumps({"backend": args.backend, "runs": args.runs, "results": measure(args.backend, args.runs)}, indent=2))
@@ -0,0 +1,148 @@
+"""
+Seeded synthetic data at realistic volumes for the benchmarks.
+
+Migrates and seeds the databases from backend/resources, then adds factories,
+workers and incidents (each with a response to every check question) that
+reference the real lookup rows. The same --seed always produces the same rows.
+Incidents are skewed towards a few large factories and spread over the last
+--months months, and the risk rollup is rebuilt at the end.
+
+The databases are the ones named by DATABASE_URL and AUTH_DATABASE_URL:
+
+  DATABASE_URL=sqlite:////tmp/bench/database.db AUTH_DATABASE_URL=sqlite:////tmp/bench/user.db \
+    python benchmarks/synthetic_data.py --incidents 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+import db
+from bootstrap import bootstrapAll
+from incident_sync import nextChangeSequences
+from risk_rollup import rebuildRiskRollup
+
+def lookupIds(session: Session, model) -> list[int]:
+  return list(session.scalars(select(model.id).order_by(model.id)))
+
+def insertInBatches(session, table, rows, batchSize: int) -> int:
+  """executemany `rows` (any iterable of dicts) into `table`, committing every `batchSize` rows."""
+  inserted = 0
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) == batchSize:
+      session.execute(insert(table), batch)
+      session.commit()
+      inserted += len(batch)
+      batch = []
+  if batch:
+    session.execute(insert(table), batch)
+    session.commit()
+    inserted += len(batch)
+  return inserted
+
+def generateDataset(factories: int, workers: int, incidents: int, months: int = 24, seed: int = 0, batchSize: int = 10000) -> dict:
+  """
+  Fill the database behind db.engine (DATABASE_URL) with synthetic rows.
+  Returns the row counts and how long generation took.
+  """
+  started = time.perf_counter()
+  bootstrapAll()
+  rng = random.Random(seed)
+
+  with Session(db.engine) as session:
+    workforceSizeRangeIds = lookupIds(session, db.WorkforceSizeRange)
+    ageRangeIds = lookupIds(session, db.AgeRange)
+    workExperienceRangeIds = lookupIds(session, db.WorkExperienceRange)
+    threatTypeIds = lookupIds(session, db.ThreatType)
+    workTypeIds = lookupIds(session, db.WorkType)
+    industryTypeLargeIds = lookupIds(session, db.IndustryTypeLarge)
+    industryTypeMediumIds = lookupIds(session, db.IndustryTypeMedium)
+    checkQuestionIds = lookupIds(session, db.CheckQuestion)
+
+    # The resource files already hold a few factories; top them up to `factories`
+    existingFactories = lookupIds(session, db.Factory)
+    insertInBatches(session, db.Factory.__table__, (
+      {"name": f"합성 공장 {index}", "workforceSizeRange_id": rng.choice(workforceSizeRangeIds)}
+      for index in range(len(existingFactories), factories)
+    ), batchSize)
+    factoryIds = lookupIds(session, db.Factory)
+
+    firstWorkerId = (session.scalar(select(func.max(db.Worker.id))) or 0) + 1
+    insertInBatches(session, db.Worker.__table__, (
+      {
+        "id": firstWorkerId + index,
+        "name": f"작업자 {firstWorkerId + index}",
+        "ageRange_id": rng.choice(ageRangeIds),
+        "sex": rng.choice(["남", "여"]),
+        "workExperienceRange_id": rng.choice(workExperienceRangeIds),
+      }
+      for index in range(workers)
+    ), batchSize)
+    workerIds = range(firstWorkerId, firstWorkerId + workers)
+
+    # Zipf-like weights: the first factories report most of the incidents
+    factoryWeights = [1 / (rank + 1) for rank in range(len(factoryIds))]
+    # Lower threat levels are far more common than severe ones
+    threatLevelWeights = [40, 30, 17, 9, 4]
+    now = datetime.now().replace(microsecond=0)
+    span = timedelta(days=30 * months).total_seconds()
+    firstIncidentId = (session.scalar(select(func.max(db.Incident.id))) or 0) + 1
+    changeSeqs = nextChangeSequences(session.connection(), incidents)
+    session.commit()
+
+    def incidentRows():
+      for index in range(incidents):
+        yield {
+          "id": firstIncidentId + index,
+          "worker_id": rng.choice(workerIds),
+          "industryTypeLarge_id": rng.choice(industryTypeLargeIds),
+          "industryTypeMedium_id": rng.choice(industryTypeMediumIds),
+          "threatType_id": rng.choice(threatTypeIds),
+          "threatLevel": rng.choices(range(1, 6), threatLevelWeights)[0],
+          "workType_id": rng.choice(workTypeIds),
+          "description": f"합성 사고 {firstIncidentId + index}: " + " ".join(rng.choices(["점검", "추락", "협착", "절단", "화재", "누출", "전도", "보호구"], k=rng.randint(4, 16))),
+          "date": now - timedelta(seconds=rng.random() * span),
+          "factory_id": rng.choices(factoryIds, factoryWeights)[0],
+          "changeSeq": changeSeqs[index],
+        }
+
+    def checkResponseRows():
+      for incidentId in range(firstIncidentId, firstIncidentId + incidents):
+        for questionId in checkQuestionIds:
+          yield {"incident_id": incidentId, "question_id": questionId, "response": rng.random() < 0.7}
+
+    insertInBatches(session, db.Incident.__table__, incidentRows(), batchSize)
+    checkResponseCount = insertInBatches(session, db.CheckResponse.__table__, checkResponseRows(), batchSize)
+    rollupRows = rebuildRiskRollup(session)
+
+  return {
+    "factories": len(factoryIds),
+    "workers": workers,
+    "incidents": incidents,
+    "checkResponses": checkResponseCount,
+    "riskRollupRows": rollupRows,
+    "seed": seed,
+    "seconds": round(time.perf_counter() - started, 2),
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--factories", type=int, default=40)
+  parser.add_argument("--workers", type=int, default=5000)
+  parser.add_argument("--incidents", type=int, default=10000)
+  parser.add_argument("--months", type=int, default=24, help="incident dates span this many months back from now")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  summary = generateDataset(args.factories, args.workers, args.incidents, args.months, args.seed)
+  print(json.dumps({"database": db.DATABASE_URL, **summary}, indent=2))
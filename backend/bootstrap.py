@@ -0,0 +1,65 @@
+"""
+Schema migrations and constant data seeding for the application and auth databases,
+run from the FastAPI lifespan (unless BOOTSTRAP_ON_STARTUP=0) or as a deploy step:
+
+  python bootstrap.py [--force]
+"""
+import argparse
+import hashlib
+import os
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import db
+from db import BootstrapState
+from migrations import lockDatabase, migrateAll
+
+RESOURCES_CHECKSUM_KEY = "resourcesChecksum"
+
+def resourcesChecksum(resources: list) -> str:
+  digest = hashlib.sha256()
+  for localFileName, *_ in resources:
+    digest.update(localFileName.encode())
+    with open(os.path.join(db.RESOURCES_DIR, localFileName), "rb") as localFile:
+      digest.update(localFile.read())
+  return digest.hexdigest()
+
+def storedChecksum(session: Session):
+  return session.scalar(select(BootstrapState.value).where(BootstrapState.key == RESOURCES_CHECKSUM_KEY))
+
+def seedDatabase(engine, resources: list, force: bool = False) -> bool:
+  """
+  Seed `resources` into the migrated database behind `engine`. Returns False
+  when the stored checksum shows there was nothing to do.
+  """
+  expected = resourcesChecksum(resources)
+
+  if not force:
+    with Session(engine) as session:
+      if storedChecksum(session) == expected:
+        return False
+
+  with Session(engine) as session:
+    lockDatabase(session.connection())
+    if not force and storedChecksum(session) == expected:
+      # Another worker seeded while this one waited for the lock
+      return False
+
+    for localFileName, tableName, model, candidateKey in resources:
+      db.populateWithLocalData(session, localFileName, tableName, model, candidateKey)
+    session.merge(BootstrapState(key=RESOURCES_CHECKSUM_KEY, value=expected))
+    session.commit()
+  return True
+
+def bootstrapAll(force: bool = False):
+  """Migrate the application and auth databases, then seed the application database."""
+  migrateAll()
+  seedDatabase(db.engine, db.localDataResources, force=force)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Migrate the databases and seed constant data")
+  parser.add_argument("--force", action="store_true", help="seed even if the resource files are unchanged")
+  args = parser.parse_args()
+  bootstrapAll(force=args.force)
+  print("Bootstrap complete")
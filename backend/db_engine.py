@@ -0,0 +1,84 @@
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+# Database URLs may come from .env, which must be loaded before db.py and auth_db.py read them
+load_dotenv()
+
+# PRAGMAs applied to every new SQLite connection, selected with DB_PROFILE
+sqliteProfiles = {
+  # SQLite defaults: rollback journal, synchronous=FULL, no busy timeout
+  "default": {
+    "foreign_keys": "ON",
+  },
+  # WAL lets readers run alongside the single writer; NORMAL is durable across app crashes in WAL mode
+  "production": {
+    "foreign_keys": "ON",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    # Negative cache_size is in KiB
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+  },
+}
+
+DEFAULT_PROFILE = "production"
+
+def sqlitePragmas(profile: str) -> dict:
+  if profile not in sqliteProfiles:
+    raise ValueError(f"Unknown DB_PROFILE {profile!r}, expected one of {sorted(sqliteProfiles)}")
+  return sqliteProfiles[profile]
+
+def isSqlite(url: str) -> bool:
+  return make_url(url).get_backend_name() == "sqlite"
+
+def envFlag(name: str, default: bool) -> bool:
+  value = os.getenv(name)
+  if value is None:
+    return default
+  return value.lower() in ("1", "true", "yes", "on")
+
+def poolOptions(url: str) -> dict:
+  """Pool tunables from DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and DB_POOL_PRE_PING."""
+  if isSqlite(url) and ":memory:" in url:
+    # In-memory databases keep SQLAlchemy's single-connection pool
+    return {}
+  return {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "-1")),
+    # Server databases can drop idle connections; a local SQLite file cannot
+    "pool_pre_ping": envFlag("DB_POOL_PRE_PING", not isSqlite(url)),
+  }
+
+def createEngine(url: str, profile: str = None, **engineOptions):
+  """
+  Create an engine for `url` with the DB_POOL_* pool tunables from the environment.
+  SQLite engines get the PRAGMAs of `profile` (default: DB_PROFILE) on every connection;
+  PostgreSQL engines get DB_STATEMENT_TIMEOUT_MS as their statement_timeout.
+  """
+  options = poolOptions(url)
+  statementTimeout = os.getenv("DB_STATEMENT_TIMEOUT_MS")
+  if isSqlite(url):
+    options["connect_args"] = {"check_same_thread": False}
+  elif statementTimeout and make_url(url).get_backend_name() == "postgresql":
+    options["connect_args"] = {"options": f"-c statement_timeout={int(statementTimeout)}"}
+  options.update(engineOptions)
+  engine = create_engine(url, **options)
+
+  if isSqlite(url):
+    pragmas = sqlitePragmas(profile or os.getenv("DB_PROFILE", DEFAULT_PROFILE))
+
+    @event.listens_for(engine, "connect")
+    def setSqlitePragmas(dbapi_connection, connection_record):
+      cursor = dbapi_connection.cursor()
+      for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+      cursor.close()
+
+  return engine
@@ -0,0 +1,315 @@
+"""
+Idempotency-Key support for POST requests to IDEMPOTENT_PATHS: the first request
+with a key runs, and retries with the same key get its stored response back.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from db import IdempotencyKey, SessionLocal
+from metrics import recordCacheLookup
+
+logger = logging.getLogger("fastapi")
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "1024"))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+IDEMPOTENCY_PURGE_BATCH_SIZE = int(os.getenv("IDEMPOTENCY_PURGE_BATCH_SIZE", "500"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = int(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "300"))
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENT_PATHS = {"/incidents", "/incidents/bulk", "/reports", "/workers", "/auth/user"}
+
+class StoredResponse:
+  """The row of a key: a completed response, or pending (status None) while its request runs."""
+
+  def __init__(self, requestHash: str, status, contentType, body, expiresAt: datetime):
+    self.requestHash = requestHash
+    self.status = status
+    self.contentType = contentType
+    self.body = body
+    self.expiresAt = expiresAt
+
+  @classmethod
+  def fromRow(cls, row: IdempotencyKey) -> "StoredResponse":
+    return cls(row.requestHash, row.status, row.contentType, row.body, row.expiresAt)
+
+  @property
+  def pending(self) -> bool:
+    return self.status is None
+
+  def response(self) -> Response:
+    headers = {"idempotent-replayed": "true"}
+    if self.contentType is not None:
+      headers["content-type"] = self.contentType
+    return Response(content=self.body, status_code=self.status, headers=headers)
+
+def requestHash(method: str, path: str, queryString: bytes, body: bytes) -> str:
+  digest = hashlib.sha256()
+  for part in (method.encode(), path.encode(), queryString, body):
+    # Length-prefixed so that no two different requests hash the same parts
+    digest.update(len(part).to_bytes(8, "big"))
+    digest.update(part)
+  return digest.hexdigest()
+
+class IdempotencyStore:
+  """
+  The idempotency_key table behind a bounded LRU of completed responses.
+  The database methods are blocking; the middleware runs them in the threadpool.
+  """
+
+  def __init__(self, sessionFactory=SessionLocal, maxSize: int = IDEMPOTENCY_CACHE_SIZE):
+    self.sessionFactory = sessionFactory
+    self.lock = threading.Lock()
+    self.maxSize = maxSize
+    # key -> StoredResponse of a completed request
+    self.entries = OrderedDict()
+    # key -> asyncio.Event set when the request running the key finishes; only used on the event loop
+    self.inFlight = {}
+    self.lastPurge = time.monotonic()
+    self.executed = 0
+    self.replayed = 0
+    self.coalesced = 0
+    self.conflicts = 0
+    self.purged = 0
+
+  def cached(self, key: str):
+    with self.lock:
+      stored = self.entries.get(key)
+      if stored is not None and stored.expiresAt <= datetime.now():
+        del self.entries[key]
+        stored = None
+      if stored is not None:
+        self.entries.move_to_end(key)
+    recordCacheLookup("idempotency", stored is not None)
+    return stored
+
+  def remember(self, key: str, stored: StoredResponse):
+    if self.maxSize <= 0:
+      return
+    with self.lock:
+      self.entries[key] = stored
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.maxSize:
+        self.entries.popitem(last=False)
+
+  def reserve(self, key: str, requestHash: str):
+    """
+    Claim `key` for a request about to run. Returns None once claimed, otherwise
+    the key's current row (pending while another process still runs it).
+    """
+    now = datetime.now()
+    with self.sessionFactory() as session:
+      # An expired key is free again, and so is a pending key whose request died
+      session.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.key == key,
+        or_(
+          IdempotencyKey.expiresAt <= now,
+          and_(IdempotencyKey.status.is_(None), IdempotencyKey.createdAt <= now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)),
+        ),
+      ))
+      session.add(IdempotencyKey(key=key, requestHash=requestHash, createdAt=now, expiresAt=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)))
+      try:
+        session.commit()
+        return None
+      except IntegrityError:
+        session.rollback()
+      row = session.get(IdempotencyKey, key)
+      if row is None:
+        # Released by its request between our insert and this read; the client retries
+        return StoredResponse(requestHash, None, None, None, now)
+      stored = StoredResponse.fromRow(row)
+    if not stored.pending:
+      self.remember(key, stored)
+    return stored
+
+  def complete(self, key: str, requestHash: str, status: int, contentType, body: bytes):
+    stored = StoredResponse(requestHash, status, contentType, body, datetime.now() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS))
+    with self.sessionFactory() as session:
+      result = session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == key, IdempotencyKey.requestHash == requestHash, IdempotencyKey.status.is_(None))
+        .values(status=status, contentType=contentType, body=body, expiresAt=stored.expiresAt)
+      )
+      session.commit()
+    if result.rowcount == 1:
+      self.remember(key, stored)
+    else:
+      logger.warning("Idempotency key taken over before its request finished", extra={"idempotencyKey": key})
+
+  def release(self, key: str, requestHash: str):
+    with self.sessionFactory() as session:
+      session.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.key == key, IdempotencyKey.requestHash == requestHash, IdempotencyKey.status.is_(None)
+      ))
+      session.commit()
+
+  def purgeExpired(self, batchSize: int = IDEMPOTENCY_PURGE_BATCH_SIZE) -> int:
+    """Delete expired keys, `batchSize` rows per transaction so writers are never blocked for long. Returns the number deleted."""
+    now = datetime.now()
+    purged = 0
+    with self.sessionFactory() as session:
+      while True:
+        keys = session.scalars(select(IdempotencyKey.key).where(IdempotencyKey.expiresAt <= now).limit(batchSize)).all()
+        if keys:
+          session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(keys)))
+          session.commit()
+          purged += len(keys)
+        if len(keys) < batchSize:
+          break
+    with self.lock:
+      for key in [key for key, stored in self.entries.items() if stored.expiresAt <= now]:
+        del self.entries[key]
+      self.purged += purged
+    return purged
+
+  def purgeIfDue(self):
+    with self.lock:
+      if time.monotonic() - self.lastPurge < IDEMPOTENCY_PURGE_INTERVAL_SECONDS:
+        return
+      self.lastPurge = time.monotonic()
+    self.purgeExpired()
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+  def stats(self) -> dict:
+    with self.lock:
+      return {
+        "size": len(self.entries),
+        "maxSize": self.maxSize,
+        "inFlight": len(self.inFlight),
+        "executed": self.executed,
+        "replayed": self.replayed,
+        "coalesced": self.coalesced,
+        "conflicts": self.conflicts,
+        "purged": self.purged,
+      }
+
+idempotencyStore = IdempotencyStore()
+
+def headerValue(scope, name: bytes):
+  for headerName, value in scope["headers"]:
+    if headerName == name:
+      return value.decode("latin-1")
+  return None
+
+async def readBody(receive) -> bytes:
+  chunks = []
+  while True:
+    message = await receive()
+    if message["type"] != "http.request":
+      break
+    chunks.append(message.get("body", b""))
+    if not message.get("more_body", False):
+      break
+  return b"".join(chunks)
+
+class IdempotencyMiddleware:
+  """Pure ASGI middleware applying Idempotency-Key to POSTs to IDEMPOTENT_PATHS."""
+
+  def __init__(self, app, store: IdempotencyStore = idempotencyStore):
+    self.app = app
+    self.store = store
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http" or scope["method"] != "POST":
+      await self.app(scope, receive, send)
+      return
+    path = scope["path"]
+    rootPath = scope.get("root_path", "")
+    if rootPath and path.startswith(rootPath):
+      path = path[len(rootPath):]
+    key = headerValue(scope, b"idempotency-key")
+    if path not in IDEMPOTENT_PATHS or key is None:
+      await self.app(scope, receive, send)
+      return
+
+    if not key or len(key) > MAX_KEY_LENGTH:
+      await JSONResponse({"detail": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"}, status_code=400)(scope, receive, send)
+      return
+
+    body = await readBody(receive)
+    requestDigest = requestHash(scope["method"], path, scope.get("query_string", b""), body)
+    store = self.store
+
+    while True:
+      stored = store.cached(key)
+      if stored is None:
+        running = store.inFlight.get(key)
+        if running is not None:
+          # The same key is running in this process: wait for it, then replay its response or run if it failed
+          store.coalesced += 1
+          await running.wait()
+          continue
+        finished = asyncio.Event()
+        store.inFlight[key] = finished
+        try:
+          stored = await run_in_threadpool(store.reserve, key, requestDigest)
+          if stored is None:
+            await self.execute(scope, receive, send, key, requestDigest, body)
+            return
+        finally:
+          del store.inFlight[key]
+          finished.set()
+      break
+
+    if stored.requestHash != requestDigest:
+      await JSONResponse({"detail": "Idempotency-Key was already used for a different request"}, status_code=422)(scope, receive, send)
+    elif stored.pending:
+      store.conflicts += 1
+      await JSONResponse(
+        {"detail": "A request with this Idempotency-Key is still being processed"},
+        status_code=409,
+        headers={"retry-after": "1"},
+      )(scope, receive, send)
+    else:
+      store.replayed += 1
+      await stored.response()(scope, receive, send)
+
+  async def execute(self, scope, receive, send, key: str, requestDigest: str, body: bytes):
+    """Run the endpoint with the already read body, then store its response or release the key."""
+    bodySent = False
+    status = None
+    contentType = None
+    chunks = []
+
+    async def replayBody():
+      nonlocal bodySent
+      if bodySent:
+        # Only a disconnect is left to receive
+        return await receive()
+      bodySent = True
+      return {"type": "http.request", "body": body, "more_body": False}
+
+    async def sendAndCapture(message):
+      nonlocal status, contentType
+      if message["type"] == "http.response.start":
+        status = message["status"]
+        contentType = next((value.decode("latin-1") for name, value in message.get("headers", []) if name.lower() == b"content-type"), None)
+      elif message["type"] == "http.response.body":
+        chunks.append(message.get("body", b""))
+      await send(message)
+
+    self.store.executed += 1
+    try:
+      await self.app(scope, replayBody, sendAndCapture)
+    except Exception:
+      await run_in_threadpool(self.store.release, key, requestDigest)
+      raise
+    if status is not None and 200 <= status < 300:
+      await run_in_threadpool(self.store.complete, key, requestDigest, status, contentType, b"".join(chunks))
+      await run_in_threadpool(self.store.purgeIfDue)
+    else:
+      await run_in_threadpool(self.store.release, key, requestDigest)
@@ -0,0 +1,101 @@
+import csv
+import io
+
+from sqlalchemy.orm import Session
+
+from db import Incident
+from model import CheckResponseFormat, IncidentResponse
+from serialization import BatchSerializer, dumpJson, serializeIncidentDicts
+
+# Rows fetched per round trip from the server-side cursor, and serialized per chunk
+EXPORT_BATCH_SIZE = 500
+
+csvColumns = [
+  "id",
+  "date",
+  "factory_id",
+  "factory",
+  "factoryWorkforceSizeRange",
+  "worker_id",
+  "worker",
+  "workerSex",
+  "workerAgeRange",
+  "workerWorkExperienceRange",
+  "industryTypeLarge",
+  "industryTypeMedium",
+  "threatType",
+  "threatLevel",
+  "workType",
+  "description",
+  "checkResponses",
+]
+
+def iterIncidentBatches(query, db: Session, serializeBatch):
+  """Stream incidents from a server-side cursor and yield them serialized with serializeBatch, one batch at a time."""
+  # Reused across batches for the reference data it built; workers and factories
+  # are dropped after each batch, so memory stays bounded by EXPORT_BATCH_SIZE
+  serializer = BatchSerializer(db)
+  batch = []
+  for incident in query.yield_per(EXPORT_BATCH_SIZE):
+    batch.append(incident)
+    if len(batch) == EXPORT_BATCH_SIZE:
+      yield serializeBatch(serializer, batch)
+      serializer.forgetLoadedRows()
+      batch = []
+  if batch:
+    yield serializeBatch(serializer, batch)
+
+def serializeBatch(serializer: BatchSerializer, incidents: list[Incident]) -> list[IncidentResponse]:
+  serializer.load(incidents)
+  checkResponses = serializer.loadCheckResponses([incident.id for incident in incidents])
+  return [
+    serializer.build(incident, additionalAttributes={"check_responses": checkResponses[incident.id]})
+    for incident in incidents
+  ]
+
+def incidentToCsvRow(incident: IncidentResponse) -> list:
+  return [
+    incident.id,
+    incident.date.isoformat(),
+    incident.factory.id,
+    incident.factory.name,
+    incident.factory.workforceSizeRange.range,
+    incident.worker.id,
+    incident.worker.name,
+    incident.worker.sex,
+    incident.worker.ageRange.range,
+    incident.worker.workExperienceRange.range,
+    incident.industryTypeLarge.name,
+    incident.industryTypeMedium.name,
+    incident.threatType.name,
+    incident.threatLevel,
+    incident.workType.name,
+    incident.description,
+    "; ".join(f"{question.question}={response}" for question, response in incident.check_responses.items()),
+  ]
+
+def exportNdjson(query, db: Session, checkResponseFormat: CheckResponseFormat = "full"):
+  """One incident per line; in the compact format the questions are not repeated, see /checks."""
+  def serializeBatchDicts(serializer: BatchSerializer, incidents: list[Incident]) -> list[dict]:
+    return serializeIncidentDicts(incidents, db, checkResponseFormat, serializer)
+
+  try:
+    for incidents in iterIncidentBatches(query, db, serializeBatchDicts):
+      yield b"".join(dumpJson(incident) + b"\n" for incident in incidents)
+  finally:
+    db.close()
+
+def exportCsv(query, db: Session):
+  try:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(csvColumns)
+    # Send the header right away so the client sees the first byte before any row is fetched
+    yield buffer.getvalue()
+    for incidents in iterIncidentBatches(query, db, serializeBatch):
+      buffer.seek(0)
+      buffer.truncate()
+      writer.writerows(incidentToCsvRow(incident) for incident in incidents)
+      yield buffer.getvalue()
+  finally:
+    db.close()
@@ -0,0 +1,149 @@
+import json
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from db import Incident, Factory, Worker, CheckResponse
+from model import IncidentInput, BulkIncidentError, BulkIncidentResult, ReportAcknowledgement, ReportInput
+from reference_cache import referenceDataCache, referenceModels
+from incident_sync import nextChangeSequences
+from live_feed import incidentEvent, incidentFeed
+from risk_rollup import recordIncidents
+from serialization import chunked, serializeIncidents
+
+MAX_BULK_INCIDENTS = 1000
+
+def parseBulkBody(body: bytes, contentType: str) -> list:
+  """Accept either a JSON array or an NDJSON body (one incident per line)."""
+  try:
+    if contentType.startswith("application/x-ndjson"):
+      items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+      items = json.loads(body)
+  except ValueError:
+    raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+  if not isinstance(items, list):
+    raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+  if len(items) > MAX_BULK_INCIDENTS:
+    raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_INCIDENTS} incidents per request")
+  return items
+
+def formatValidationError(error: ValidationError) -> str:
+  return "; ".join(f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors())
+
+def loadExistingIds(db: Session, model, ids: set) -> set:
+  existingIds = set()
+  for idChunk in chunked(sorted(ids)):
+    existingIds.update(id for (id,) in db.query(model.id).filter(model.id.in_(idChunk)).all())
+  return existingIds
+
+def insertCheckResponses(db: Session, checkResponsesByIncident: dict[int, dict[int, bool]]):
+  """Write the check responses of any number of incidents with a single executemany."""
+  rows = [
+    {"incident_id": incidentId, "question_id": questionId, "response": response}
+    for incidentId, checkResponses in checkResponsesByIncident.items()
+    for questionId, response in checkResponses.items()
+  ]
+  if rows:
+    db.execute(insert(CheckResponse), rows)
+
+def ingestIncidents(items: list, db: Session, echo: bool = False) -> BulkIncidentResult:
+  """
+  Validate every row, then insert all valid incidents and their check responses
+  with executemany in a single transaction. Invalid rows are reported, not inserted.
+  """
+  errors = []
+  validated = []
+  for index, item in enumerate(items):
+    try:
+      validated.append((index, IncidentInput.model_validate(item)))
+    except ValidationError as e:
+      errors.append(BulkIncidentError(index=index, detail=formatValidationError(e)))
+
+  # Foreign key id sets: lookups from the reference cache, the rest with one IN query per table
+  # Only ids the batch uses may trigger a reload of the cache
+  incidentReferences = [varName for varName in referenceModels if f"{varName}_id" in IncidentInput.model_fields]
+  wantedIds = {varName: set() for varName in referenceModels}
+  for _, incident in validated:
+    for varName in incidentReferences:
+      wantedIds[varName].add(getattr(incident, f"{varName}_id"))
+    wantedIds["checkQuestion"].update(incident.check_responses)
+  knownIds = {varName: referenceDataCache.ids(db, varName, wantedIds[varName]) for varName in referenceModels}
+  knownIds["worker"] = loadExistingIds(db, Worker, {incident.worker_id for _, incident in validated})
+  knownIds["factory"] = loadExistingIds(db, Factory, {incident.factory_id for _, incident in validated})
+
+  accepted = []
+  for index, incident in validated:
+    row = incident.model_dump(exclude={"check_responses"})
+    missing = [key.replace("_id", "") for key, value in row.items() if key.endswith("_id") and value not in knownIds[key.replace("_id", "")]]
+    missing += [f"checkQuestion {questionId}" for questionId in incident.check_responses if questionId not in knownIds["checkQuestion"]]
+    if missing:
+      errors.append(BulkIncidentError(index=index, detail=f"{', '.join(missing)} not found"))
+    else:
+      accepted.append((index, row, incident.check_responses))
+
+  ids = [None] * len(items)
+  if accepted:
+    rows = [row for _, row, _ in accepted]
+    # Core inserts bypass the ORM flush that stamps changeSeq
+    for row, changeSeq in zip(rows, nextChangeSequences(db.connection(), len(rows))):
+      row["changeSeq"] = changeSeq
+    newIds = db.scalars(insert(Incident).returning(Incident.id, sort_by_parameter_order=True), rows).all()
+    checkResponsesByIncident = {}
+    for (index, _, checkResponses), newId in zip(accepted, newIds):
+      ids[index] = newId
+      checkResponsesByIncident[newId] = checkResponses
+    insertCheckResponses(db, checkResponsesByIncident)
+    # A Core insert, so the rollup is not maintained by the flush hook
+    recordIncidents(db, [Incident(**row) for row in rows])
+    db.commit()
+    for row, newId in zip(rows, newIds):
+      incidentFeed.publish(row["factory_id"], incidentEvent(newId, row))
+
+  errors.sort(key=lambda error: error.index)
+  result = BulkIncidentResult(ids=ids, errors=errors)
+  if echo:
+    newIds = [id for id in ids if id is not None]
+    incidents = []
+    for idChunk in chunked(newIds):
+      incidents.extend(db.query(Incident).filter(Incident.id.in_(idChunk)).order_by(Incident.id).all())
+    result.incidents = serializeIncidents(incidents, db)
+  return result
+
+def submitReport(report: ReportInput, db: Session) -> ReportAcknowledgement:
+  """
+  Create the reporting worker, the incident and its check responses with a single
+  commit. Every id is checked first (lookups against the reference cache, the
+  factory with one query), so nothing is written when any of them is unknown.
+  """
+  references = {
+    "ageRange": report.worker.ageRange_id,
+    "workExperienceRange": report.worker.workExperienceRange_id,
+    "industryTypeLarge": report.industryTypeLarge_id,
+    "industryTypeMedium": report.industryTypeMedium_id,
+    "threatType": report.threatType_id,
+    "workType": report.workType_id,
+  }
+  missing = [varName for varName, id in references.items() if id not in referenceDataCache.ids(db, varName, [id])]
+  checkQuestionIds = referenceDataCache.ids(db, "checkQuestion", report.check_responses)
+  missing += [f"checkQuestion {questionId}" for questionId in report.check_responses if questionId not in checkQuestionIds]
+  if not loadExistingIds(db, Factory, {report.factory_id}):
+    missing.append("factory")
+  if missing:
+    raise HTTPException(status_code=404, detail=f"{', '.join(missing)} not found")
+
+  worker = Worker(**report.worker.model_dump())
+  db.add(worker)
+  # Assign the ids so the incident and check responses can reference them in the same transaction
+  db.flush()
+  incident = Incident(worker_id=worker.id, **report.model_dump(exclude={"worker", "check_responses"}))
+  db.add(incident)
+  db.flush()
+  insertCheckResponses(db, {incident.id: report.check_responses})
+  # Read before the commit expires the instances, which would cost a SELECT each
+  acknowledgement = ReportAcknowledgement(incident_id=incident.id, worker_id=worker.id)
+  db.commit()
+  incidentFeed.publish(report.factory_id, incidentEvent(acknowledgement.incident_id, {**report.model_dump(), "worker_id": acknowledgement.worker_id}))
+  return acknowledgement
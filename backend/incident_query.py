@@ -0,0 +1,65 @@
+import base64
+import json
+
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+
+from db import Incident
+from model import IncidentFilters
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def applyIncidentFilters(query, filters: IncidentFilters):
+  if filters.dateFrom is not None:
+    query = query.filter(Incident.date >= filters.dateFrom)
+  if filters.dateTo is not None:
+    query = query.filter(Incident.date < filters.dateTo)
+  if filters.factory_id is not None:
+    query = query.filter(Incident.factory_id == filters.factory_id)
+  if filters.threatType_id is not None:
+    query = query.filter(Incident.threatType_id == filters.threatType_id)
+  if filters.workType_id is not None:
+    query = query.filter(Incident.workType_id == filters.workType_id)
+  if filters.worker_id is not None:
+    query = query.filter(Incident.worker_id == filters.worker_id)
+  if filters.threatLevelMin is not None:
+    query = query.filter(Incident.threatLevel >= filters.threatLevelMin)
+  if filters.threatLevelMax is not None:
+    query = query.filter(Incident.threatLevel <= filters.threatLevelMax)
+  return query
+
+def monthOf(column, db: Session):
+  """'YYYY-MM' of a datetime column, in the dialect of the session's database."""
+  if db.get_bind().dialect.name == "postgresql":
+    return func.to_char(column, "YYYY-MM")
+  return func.strftime("%Y-%m", column)
+
+def encodeCursor(incident: Incident) -> str:
+  payload = json.dumps([incident.date.isoformat(), incident.id])
+  return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decodeCursor(cursor: str) -> tuple[datetime, int]:
+  try:
+    date, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(date), int(id)
+  except (ValueError, TypeError):
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginateIncidents(query, limit: Optional[int], cursor: str = None) -> tuple[list[Incident], str]:
+  """
+  Keyset pagination over (date, id), newest first.
+  Returns one page of incidents and the cursor of the next page (None on the last page).
+  Without a limit, the page is every incident after the cursor.
+  """
+  if cursor:
+    cursorDate, cursorId = decodeCursor(cursor)
+    query = query.filter(tuple_(Incident.date, Incident.id) < (cursorDate, cursorId))
+  if limit is None:
+    return query.order_by(Incident.date.desc(), Incident.id.desc()).all(), None
+  incidents = query.order_by(Incident.date.desc(), Incident.id.desc()).limit(limit + 1).all()
+  nextCursor = encodeCursor(incidents[limit - 1]) if len(incidents) > limit else None
+  return incidents[:limit], nextCursor
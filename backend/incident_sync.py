@@ -0,0 +1,144 @@
+"""
+Change numbers (changeSeq) and tombstones behind GET /incidents/sync, which
+returns only the incidents changed after a client's cursor.
+"""
+import base64
+import json
+
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import bindparam, event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from db import ChangeSequence, CheckResponse, Incident, IncidentTombstone
+from model import CheckResponseFormat
+from serialization import checkQuestionCatalog, serializeIncidentDicts
+
+SEQUENCE_NAME = "incident"
+
+def seedChangeSequence(connection):
+  """
+  Create the counter row, starting after the highest change number already
+  used. Concurrent callers race harmlessly: the first insert wins and the
+  others do nothing.
+  """
+  start = max(
+    connection.execute(select(func.max(Incident.__table__.c.changeSeq))).scalar() or 0,
+    connection.execute(select(func.max(IncidentTombstone.__table__.c.changeSeq))).scalar() or 0,
+  )
+  dialectInsert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+  connection.execute(
+    dialectInsert(ChangeSequence.__table__).values(name=SEQUENCE_NAME, value=start).on_conflict_do_nothing()
+  )
+
+def nextChangeSequences(connection, count: int) -> range:
+  """
+  Reserve `count` consecutive change numbers in the transaction of `connection`.
+  The counter row stays locked until that transaction ends, so changes commit in number order.
+  """
+  if count == 0:
+    return range(0)
+  increment = (
+    update(ChangeSequence.__table__)
+    .where(ChangeSequence.__table__.c.name == SEQUENCE_NAME)
+    .values(value=ChangeSequence.__table__.c.value + count)
+    .returning(ChangeSequence.__table__.c.value)
+  )
+  last = connection.execute(increment).scalar()
+  if last is None:
+    # Migration 0006 seeds the row; a database made by create_all (the tests) gets it on its first change
+    seedChangeSequence(connection)
+    last = connection.execute(increment).scalar()
+  return range(last - count + 1, last + 1)
+
+@event.listens_for(Session, "before_flush")
+def stampIncidentChanges(session, flushContext, instances):
+  changed = [instance for instance in session.new if isinstance(instance, Incident)]
+  changed += [instance for instance in session.dirty if isinstance(instance, Incident) and session.is_modified(instance)]
+  deleted = [instance for instance in session.deleted if isinstance(instance, Incident)]
+  # Incidents whose check responses changed through the ORM, unless already stamped above
+  stampedIds = {instance.id for instance in changed + deleted}
+  checkResponseIncidentIds = sorted({
+    instance.incident_id for instance in (*session.new, *session.dirty, *session.deleted)
+    if isinstance(instance, CheckResponse) and instance.incident_id is not None and instance.incident_id not in stampedIds
+  })
+  # An incident moved to another factory is deleted from its old factory's point of view
+  moved = [
+    (instance, inspect(instance).attrs.factory_id.history.deleted[0]) for instance in changed
+    if instance not in session.new and inspect(instance).attrs.factory_id.history.deleted
+  ]
+  count = len(changed) + len(deleted) + len(checkResponseIncidentIds) + len(moved)
+  if count == 0:
+    return
+
+  connection = session.connection()
+  sequences = iter(nextChangeSequences(connection, count))
+  now = datetime.now()
+  # Tombstones first, so a moved incident's own change comes after its old factory's tombstone
+  for incident, oldFactoryId in moved:
+    session.merge(IncidentTombstone(incident_id=incident.id, factory_id=oldFactoryId, changeSeq=next(sequences), deletedAt=now))
+  for incident in deleted:
+    session.merge(IncidentTombstone(incident_id=incident.id, factory_id=incident.factory_id, changeSeq=next(sequences), deletedAt=now))
+  for incident in changed:
+    incident.changeSeq = next(sequences)
+  if checkResponseIncidentIds:
+    incidentTable = Incident.__table__
+    connection.execute(
+      update(incidentTable).where(incidentTable.c.id == bindparam("incidentId")).values(changeSeq=bindparam("changeSeq")),
+      [{"incidentId": incidentId, "changeSeq": next(sequences)} for incidentId in checkResponseIncidentIds]
+    )
+
+def encodeSyncCursor(changeSeq: int) -> str:
+  return base64.urlsafe_b64encode(json.dumps([changeSeq]).encode()).decode()
+
+def decodeSyncCursor(cursor: str) -> int:
+  try:
+    changeSeq, = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return int(changeSeq)
+  except (ValueError, TypeError):
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def syncIncidents(db: Session, cursor: str, limit: int, factory_id: int = None) -> tuple[list[Incident], list[int], str, bool]:
+  """
+  The first `limit` changes after `cursor` (from the beginning without one), in change order.
+  Returns the changed incidents, the ids of deleted incidents, the cursor of the last
+  change returned and whether more changes follow.
+  """
+  since = decodeSyncCursor(cursor) if cursor else 0
+  incidentQuery = db.query(Incident).filter(Incident.changeSeq > since)
+  tombstoneQuery = db.query(IncidentTombstone.changeSeq, IncidentTombstone.incident_id).filter(IncidentTombstone.changeSeq > since)
+  if factory_id is not None:
+    incidentQuery = incidentQuery.filter(Incident.factory_id == factory_id)
+    tombstoneQuery = tombstoneQuery.filter(IncidentTombstone.factory_id == factory_id)
+  # Both walk a (factory_id, changeSeq) or (changeSeq) index; the page is the first `limit` of the two merged
+  incidents = incidentQuery.order_by(Incident.changeSeq).limit(limit + 1).all()
+  tombstones = tombstoneQuery.order_by(IncidentTombstone.changeSeq).limit(limit + 1).all()
+  changes = sorted(
+    [(incident.changeSeq, incident.id, incident) for incident in incidents]
+    + [(changeSeq, incidentId, None) for changeSeq, incidentId in tombstones],
+    key=lambda change: change[0]
+  )
+  page = changes[:limit]
+
+  # An id deleted and created again within the page only reports its latest state
+  latest = {}
+  for _, incidentId, incident in page:
+    latest.pop(incidentId, None)
+    latest[incidentId] = incident
+  changedIncidents = [incident for incident in latest.values() if incident is not None]
+  deletedIds = [incidentId for incidentId, incident in latest.items() if incident is None]
+  lastSeq = page[-1][0] if page else since
+  return changedIncidents, deletedIds, encodeSyncCursor(lastSeq), len(changes) > limit
+
+def syncContent(incidents: list[Incident], deletedIds: list[int], cursor: str, hasMore: bool, db: Session, checkResponseFormat: CheckResponseFormat = "full") -> dict:
+  """Content of IncidentSyncResponse, or of CompactIncidentSyncResponse with the question catalog."""
+  content = {
+    "incidents": serializeIncidentDicts(incidents, db, checkResponseFormat),
+    "deleted": deletedIds,
+    "cursor": cursor,
+    "hasMore": hasMore,
+  }
+  if checkResponseFormat == "compact":
+    content["checkQuestions"] = checkQuestionCatalog(db)
+  return content
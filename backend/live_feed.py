@@ -0,0 +1,194 @@
+"""
+GET /incidents/live: committed incidents as Server-Sent Events, fanned out by an
+in-process broker, so each uvicorn worker's subscribers only see its own commits.
+"""
+import asyncio
+import logging
+import os
+import threading
+import uuid
+
+from collections import deque
+from fastapi import HTTPException
+
+from model import IncidentBase
+from serialization import dumpJson
+
+logger = logging.getLogger("fastapi")
+
+LIVE_FEED_QUEUE_SIZE = int(os.getenv("LIVE_FEED_QUEUE_SIZE", "100"))
+LIVE_FEED_BUFFER_SIZE = int(os.getenv("LIVE_FEED_BUFFER_SIZE", "1000"))
+LIVE_FEED_HEARTBEAT_SECONDS = float(os.getenv("LIVE_FEED_HEARTBEAT_SECONDS", "15"))
+LIVE_FEED_MAX_SUBSCRIBERS = int(os.getenv("LIVE_FEED_MAX_SUBSCRIBERS", "10000"))
+# Reconnection delay sent to EventSource clients
+LIVE_FEED_RETRY_MS = 3000
+
+# Fields of an incident event besides its id; names and nested objects are left to the reference data
+EVENT_FIELDS = tuple(IncidentBase.model_fields)
+
+HEARTBEAT = b": heartbeat\n\n"
+RESET = b"event: reset\ndata: {}\n\n"
+# Queued in place of events when the subscriber is disconnected
+CLOSED = object()
+
+def incidentEvent(incidentId: int, values: dict) -> dict:
+  """The event of an incident, from its column values (an IncidentBase dump or an inserted row)."""
+  return {"id": incidentId, **{field: values[field] for field in EVENT_FIELDS}}
+
+class LiveEvent:
+  def __init__(self, number: int, factoryId: int, message: bytes):
+    self.number = number
+    self.factoryId = factoryId
+    self.message = message
+
+class Subscriber:
+  def __init__(self, factoryId, lastNumber: int):
+    # None: every factory
+    self.factoryId = factoryId
+    self.queue = asyncio.Queue(LIVE_FEED_QUEUE_SIZE)
+    # Number of the last event queued or replayed; fan-out skips anything up to it
+    self.lastNumber = lastNumber
+
+  def close(self):
+    # Whatever is still queued is dropped; the client gets it by replay when it reconnects
+    while not self.queue.empty():
+      self.queue.get_nowait()
+    self.queue.put_nowait(CLOSED)
+
+class IncidentFeed:
+  """
+  In-process pub/sub of committed incidents. publish may be called from any
+  thread; everything touching subscribers runs on the event loop.
+  """
+
+  def __init__(self, bufferSize: int = LIVE_FEED_BUFFER_SIZE, maxSubscribers: int = LIVE_FEED_MAX_SUBSCRIBERS):
+    self.lock = threading.Lock()
+    # Event ids are "<epoch>-<number>"; a new process has a new epoch
+    self.epoch = uuid.uuid4().hex[:8]
+    self.lastNumber = 0
+    self.buffer = deque(maxlen=bufferSize)
+    self.maxSubscribers = maxSubscribers
+    # factory id (None: every factory) -> subscribers
+    self.subscribers = {}
+    self.subscriberCount = 0
+    self.loop = None
+    self.heartbeat = None
+    self.heartbeatLoop = None
+    self.published = 0
+    self.delivered = 0
+    self.dropped = 0
+
+  def publish(self, factoryId: int, payload: dict):
+    """Publish an incident; call it once its transaction has committed."""
+    with self.lock:
+      self.lastNumber += 1
+      number = self.lastNumber
+      message = b"id: %s-%d\nevent: incident\ndata: %s\n\n" % (self.epoch.encode(), number, dumpJson(payload))
+      event = LiveEvent(number, factoryId, message)
+      self.buffer.append(event)
+      self.published += 1
+      loop = self.loop
+    if loop is not None and not loop.is_closed():
+      loop.call_soon_threadsafe(self.fanOut, event)
+
+  def fanOut(self, event: LiveEvent):
+    for subscriber in (*self.subscribers.get(None, ()), *self.subscribers.get(event.factoryId, ())):
+      if event.number <= subscriber.lastNumber:
+        continue
+      try:
+        subscriber.queue.put_nowait(event.message)
+      except asyncio.QueueFull:
+        self.drop(subscriber)
+        continue
+      subscriber.lastNumber = event.number
+      self.delivered += 1
+
+  def drop(self, subscriber: Subscriber):
+    logger.warning("Live feed subscriber dropped", extra={"factoryId": subscriber.factoryId, "queueSize": LIVE_FEED_QUEUE_SIZE})
+    self.dropped += 1
+    self.unsubscribe(subscriber)
+    subscriber.close()
+
+  def parseEventId(self, eventId: str):
+    epoch, _, number = eventId.partition("-")
+    if epoch != self.epoch or not number.isdigit():
+      return None
+    return int(number)
+
+  def subscribe(self, factoryId, lastEventId: str = None) -> tuple[Subscriber, list[bytes]]:
+    """Register a subscriber and return it with the messages to replay after `lastEventId`."""
+    self.loop = asyncio.get_running_loop()
+    replay = []
+    with self.lock:
+      if lastEventId is not None:
+        resumeAfter = self.parseEventId(lastEventId)
+        oldest = self.buffer[0].number if self.buffer else self.lastNumber + 1
+        if resumeAfter is None or resumeAfter > self.lastNumber or resumeAfter < oldest - 1:
+          replay.append(RESET)
+        else:
+          replay += [
+            event.message for event in self.buffer
+            if event.number > resumeAfter and (factoryId is None or event.factoryId == factoryId)
+          ]
+      # Events published before this point are replayed or, without Last-Event-ID, not wanted
+      subscriber = Subscriber(factoryId, self.lastNumber)
+    self.subscribers.setdefault(factoryId, set()).add(subscriber)
+    self.subscriberCount += 1
+    self.scheduleHeartbeat()
+    return subscriber, replay
+
+  def unsubscribe(self, subscriber: Subscriber):
+    subscribers = self.subscribers.get(subscriber.factoryId)
+    if subscribers is None or subscriber not in subscribers:
+      return
+    subscribers.remove(subscriber)
+    if not subscribers:
+      del self.subscribers[subscriber.factoryId]
+    self.subscriberCount -= 1
+
+  def scheduleHeartbeat(self):
+    if self.heartbeat is None or self.heartbeatLoop is not self.loop:
+      self.heartbeatLoop = self.loop
+      self.heartbeat = self.loop.call_later(LIVE_FEED_HEARTBEAT_SECONDS, self.beat)
+
+  def beat(self):
+    self.heartbeat = None
+    for subscribers in self.subscribers.values():
+      for subscriber in subscribers:
+        # A subscriber with queued events is not idle
+        if subscriber.queue.empty():
+          subscriber.queue.put_nowait(HEARTBEAT)
+    if self.subscriberCount:
+      self.scheduleHeartbeat()
+
+  def checkCapacity(self):
+    if self.subscriberCount >= self.maxSubscribers:
+      raise HTTPException(status_code=503, detail="Too many live feed subscribers")
+
+  async def stream(self, factoryId, lastEventId: str = None):
+    """The body of one GET /incidents/live response."""
+    subscriber, replay = self.subscribe(factoryId, lastEventId)
+    try:
+      yield b"retry: %d\n\n" % LIVE_FEED_RETRY_MS
+      for message in replay:
+        yield message
+      while True:
+        message = await subscriber.queue.get()
+        if message is CLOSED:
+          return
+        yield message
+    finally:
+      self.unsubscribe(subscriber)
+
+  def stats(self) -> dict:
+    with self.lock:
+      return {
+        "subscribers": self.subscriberCount,
+        "published": self.published,
+        "delivered": self.delivered,
+        "dropped": self.dropped,
+        "buffered": len(self.buffer),
+        "lastEventId": f"{self.epoch}-{self.lastNumber}",
+      }
+
+incidentFeed = IncidentFeed()
@@ -1,53 +1,124 @@
+import atexit
+import json
 import logging
-import time
+import logging.handlers
 import os
+import queue
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-
-# Ensure logs directory exists
-logsDir = Path("../logs")
-logsDir.mkdir(exist_ok=True)
-
-# Configure logging
-logging.basicConfig(
-  level=logging.INFO,
-  format='%(asctime)s - %(levelname)s - %(message)s',
-  handlers=[
-    # File handler only (removed console handler)
-    logging.FileHandler(logsDir / "server.log")
-  ]
-)
-logger = logging.getLogger(__name__)
+# Log directory and rotation: LOG_ROTATION=size rotates at LOG_MAX_BYTES, LOG_ROTATION=time at LOG_ROTATE_WHEN
+logsDir = Path(os.getenv("LOG_DIR", "../logs"))
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Records waiting for the writer thread; beyond this they are dropped rather than blocking a request
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Attributes every LogRecord has; anything else was passed through `extra` and is written as a field
+standardRecordAttributes = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-  async def dispatch(self, request: Request, call_next):
-    startTime = time.time()
+class JsonFormatter(logging.Formatter):
+  """One JSON object per line: time, level, logger, message, any `extra` fields and the exception."""
 
-    # Extract request details
-    method = request.method
-    path = request.url.path
+  def format(self, record: logging.LogRecord) -> str:
+    entry = {
+      "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+      "level": record.levelname,
+      "logger": record.name,
+      "message": record.getMessage(),
+    }
+    for key, value in record.__dict__.items():
+      if key not in standardRecordAttributes:
+        entry[key] = value
+    if record.exc_info:
+      entry["exception"] = self.formatException(record.exc_info)
+    elif record.exc_text:
+      entry["exception"] = record.exc_text
+    return json.dumps(entry, ensure_ascii=False, default=str)
 
-    # Log the incoming request
-    logger.info(f"Request: {method} {path}")
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+  """QueueHandler that never blocks the caller: records are dropped (and counted) when the queue is full."""
 
+  def __init__(self, logQueue: queue.Queue):
+    super().__init__(logQueue)
+    self.dropped = 0
+
+  def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+    # Resolve the message and traceback here, but keep the `extra` fields for the JSON formatter
+    record = logging.makeLogRecord(record.__dict__)
+    record.msg = record.getMessage()
+    record.args = None
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+    return record
+
+  def enqueue(self, record: logging.LogRecord):
     try:
-      # Process the request
-      response = await call_next(request)
+      self.queue.put_nowait(record)
+    except queue.Full:
+      self.dropped += 1
+
+def createFileHandler() -> logging.Handler:
+  logsDir.mkdir(exist_ok=True)
+  logFile = logsDir / "server.log"
+  if LOG_ROTATION == "time":
+    handler = logging.handlers.TimedRotatingFileHandler(logFile, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+  else:
+    handler = logging.handlers.RotatingFileHandler(logFile, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+  handler.setFormatter(JsonFormatter())
+  return handler
 
-      # Calculate processing time
-      processingTime = time.time() - startTime
+def configureLogging() -> logging.handlers.QueueListener:
+  """Route the root logger through a queue to a rotating JSON file written on a background thread."""
+  queueHandler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+  listener = logging.handlers.QueueListener(queueHandler.queue, createFileHandler(), respect_handler_level=True)
+  rootLogger = logging.getLogger()
+  rootLogger.setLevel(logging.INFO)
+  rootLogger.addHandler(queueHandler)
+  listener.start()
+  # Flush what is still queued when the process exits
+  atexit.register(listener.stop)
+  return listener
 
-      # Log successful response
-      logger.info(f"Response: {method} {path} - Status: {response.status_code} - Time: {processingTime:.4f}s")
+logListener = configureLogging()
+logger = logging.getLogger(__name__)
 
-      return response
-    except Exception as e:
-      # Calculate processing time
-      processingTime = time.time() - startTime
+class LoggingMiddleware:
+  """
+  Pure ASGI middleware that writes one structured line per HTTP request.
+  Unlike BaseHTTPMiddleware it passes messages straight through, so streaming
+  responses are not buffered, and the duration covers the whole response body.
+  """
 
-      # Log error
-      logger.error(f"Error: {method} {path} - {str(e)} - Time: {processingTime:.4f}s")
-      raise
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    startTime = time.monotonic()
+    statusCode = None
 
+    async def sendWithStatus(message):
+      nonlocal statusCode
+      if message["type"] == "http.response.start":
+        statusCode = message["status"]
+      await send(message)
+
+    fields = {
+      "method": scope["method"],
+      "path": scope["path"],
+      "client": scope["client"][0] if scope.get("client") else None,
+    }
+    try:
+      await self.app(scope, receive, sendWithStatus)
+    except Exception:
+      logger.exception("Request failed", extra={**fields, "status": statusCode or 500, "durationMs": round((time.monotonic() - startTime) * 1000, 3)})
+      raise
+    logger.info("Request", extra={**fields, "status": statusCode, "durationMs": round((time.monotonic() - startTime) * 1000, 3)})
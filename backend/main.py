@@ -3,30 +3,72 @@ import logging
 import os
 import sys
 
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
-from fastapi import FastAPI, Request, HTTPException, status, Depends
+from fastapi import FastAPI, Request, HTTPException, status, Depends, Header, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from starlette.middleware.base import BaseHTTPMiddleware
-from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from typing import Annotated
+from typing import Annotated, Literal, Optional, Union
 
 from auth.auth import getCurrentUser, router as auth_router
-from db import get_db
+from auth.auth_db import engine as authEngine
+from auth.auth_settings import getAuthSettings
+from auth.password_hashing import passwordHasher
+from auth.token_cache import tokenCache
+from analytics import router as analytics_router
+from bootstrap import bootstrapAll
+from db import get_db, SessionLocal, engine
+from db_engine import envFlag
 from db import Incident, Factory, ThreatType, WorkType, CheckQuestion, CheckResponse, AgeRange, WorkExperienceRange, IndustryTypeLarge, IndustryTypeMedium, WorkforceSizeRange, Worker
-from model import IncidentBase, IncidentResponse, FactoryResponse, IncidentResponses, FactoryResponses, ThreatTypeResponse, ThreatTypeResponses, WorkTypeResponse, WorkTypeResponses, CheckQuestionResponse, CheckQuestionResponses, AgeRangeResponse, WorkExperienceRangeResponse, IndustryTypeLargeResponse, IndustryTypeMediumResponse, AgeRangeResponses, WorkExperienceRangeResponses, IndustryTypeLargeResponses, IndustryTypeMediumResponses, WorkforceSizeRangeResponse, WorkerResponse, WorkerResponses, WorkforceSizeRangeResponses, WorkerInput
+from model import IncidentSyncResponse, CompactIncidentSyncResponse, ReportAcknowledgement, ReportInput, ReferenceDataResponse, CheckResponseFormat, CompactIncidentResponse, CompactIncidentResponses, IncidentBase, IncidentInput, IncidentResponse, BulkIncidentResult, FactoryResponse, IncidentResponses, IncidentFilters, FactoryResponses, ThreatTypeResponse, ThreatTypeResponses, WorkTypeResponse, WorkTypeResponses, CheckQuestionResponse, CheckQuestionResponses, AgeRangeResponse, WorkExperienceRangeResponse, IndustryTypeLargeResponse, IndustryTypeMediumResponse, AgeRangeResponses, WorkExperienceRangeResponses, IndustryTypeLargeResponses, IndustryTypeMediumResponses, WorkforceSizeRangeResponse, WorkerResponse, WorkerResponses, WorkforceSizeRangeResponses, WorkerInput
+from incident_export import exportCsv, exportNdjson
+from incident_ingest import ingestIncidents, insertCheckResponses, parseBulkBody, submitReport
+from incident_sync import syncContent, syncIncidents
+from incident_query import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, applyIncidentFilters, paginateIncidents
+from serialization import BatchSerializer, FastJSONResponse, incidentListContent, serializeIncidentDicts, serializeRowDicts
+from reference_cache import referenceDataCache
+from reference_responses import referenceDataResponse, referenceResponseCache
+from idempotency import IdempotencyMiddleware, idempotencyStore
+from live_feed import incidentEvent, incidentFeed
 from logging_middleware import LoggingMiddleware
-
-app = FastAPI(root_path="/api")
+from metrics import MetricsMiddleware, instrumentEngine, markProcessDead, renderMetrics
+from query_tracker import QueryTrackingMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  # Deployments that run `python bootstrap.py` before starting workers can set BOOTSTRAP_ON_STARTUP=0
+  if envFlag("BOOTSTRAP_ON_STARTUP", True):
+    bootstrapAll()
+  # Fail at startup rather than on the first login if the auth settings are missing
+  getAuthSettings()
+  # Warm the reference data cache before serving requests
+  with SessionLocal() as db:
+    referenceDataCache.load(db)
+  yield
+  markProcessDead()
+
+app = FastAPI(root_path="/api", lifespan=lifespan)
 
 logger = logging.getLogger("fastapi")
 # Add the middleware to the app
+# Innermost, so replayed responses are still logged and counted like any other
+app.add_middleware(IdempotencyMiddleware)
 app.add_middleware(LoggingMiddleware)
+app.add_middleware(MetricsMiddleware)
+# Outside MetricsMiddleware so the request's query tracker is still set when metrics are recorded
+app.add_middleware(QueryTrackingMiddleware)
+
+# Count and time the SQL of both databases for /metrics
+instrumentEngine(engine, "app")
+instrumentEngine(authEngine, "auth")
 
 # Include the auth router
 app.include_router(auth_router)
+app.include_router(analytics_router)
 
 # Only allow requests from the local host (proxied by nginx)
 origins = [
@@ -43,113 +85,140 @@ app.add_middleware(
   allow_headers=["*"],
 )
 
-varNameToModel = {
-  "incident": Incident,
-  "factory": Factory,
-  "threatType": ThreatType,
-  "workType": WorkType,
-  "checkQuestion": CheckQuestion,
-  "ageRange": AgeRange,
-  "workExperienceRange": WorkExperienceRange,
-  "industryTypeLarge": IndustryTypeLarge,
-  "industryTypeMedium": IndustryTypeMedium,
-  "workforceSizeRange": WorkforceSizeRange,
-  "worker": Worker,
-}
-
-varNameToResponseModel = {
-  "incident": IncidentResponse,
-  "factory": FactoryResponse,
-  "threatType": ThreatTypeResponse,
-  "workType": WorkTypeResponse,
-  "checkQuestion": CheckQuestionResponse,
-  "ageRange": AgeRangeResponse,
-  "workExperienceRange": WorkExperienceRangeResponse,
-  "industryTypeLarge": IndustryTypeLargeResponse,
-  "industryTypeMedium": IndustryTypeMediumResponse,
-  "workforceSizeRange": WorkforceSizeRangeResponse,
-  "worker": WorkerResponse,
-}
-
 db_dependency = Annotated[Session, Depends(get_db)]
 user_dependency = Annotated[dict, Depends(getCurrentUser)]
 
-def convertDBModelintoResponseModel(dbModel, db: Session = Depends(get_db), additionalAttributes: dict = {}) -> BaseModel:
-  model = varNameToModel[dbModel.typeToString()]
-  dbModelDict = dbModel.__dict__.copy()
-  dbModelDict.pop("_sa_instance_state")
-  modelDict = dbModelDict.copy()
-  for key, value in dbModelDict.items():
-    if key.endswith("_id"):
-      model = varNameToModel[key.replace("_id", "")]
-      object = db.query(model).filter(model.id == value).first()
-      if object is None:
-        logger.error(f"{datetime.now()}: {key.replace('_id', '')} of id {value} not found")
-        raise HTTPException(status_code=404, detail=f"{key.replace('_id', '')} not found")
-      else:
-        modelDict[key.replace("_id", "")] = convertDBModelintoResponseModel(object, db)
-        modelDict.pop(key)
-  modelDict.update(additionalAttributes)
-  responseModel = varNameToResponseModel[dbModel.typeToString()]
-  return responseModel.model_validate(modelDict)
-
-def convertIncidentToResponse(incident: Incident, db: Session = Depends(get_db)) -> IncidentResponse:
-  # get check responses for response
-  checkResponses = db.query(CheckResponse).filter(CheckResponse.incident_id == incident.id).all()
-  checkResponsesDict = dict()
-  for checkResponse in checkResponses:
-    checkQuestion = db.query(CheckQuestion).filter(CheckQuestion.id == checkResponse.question_id).first()
-    checkResponsesDict[CheckQuestionResponse.model_validate(checkQuestion)] = checkResponse.response
-  return convertDBModelintoResponseModel(incident, db, additionalAttributes={"check_responses": checkResponsesDict})
-
-@app.get("/incidents", response_model=IncidentResponses)
-def getIncidents(db: Session = Depends(get_db)):
-  incidents = db.query(Incident).all()
-  incidents = [convertIncidentToResponse(incident, db) for incident in incidents]
-  return IncidentResponses(incidents=incidents)
+# Endpoints returning FastJSONResponse build plain dicts with the serializer's field plans;
+# their response_model documents the schema but is not validated against again
+def incidentJsonResponse(incident: Incident, db: Session, checkResponseFormat: CheckResponseFormat = "full") -> FastJSONResponse:
+  return FastJSONResponse(serializeIncidentDicts([incident], db, checkResponseFormat)[0])
+
+def rowJsonResponse(row, db: Session) -> FastJSONResponse:
+  serializer = BatchSerializer(db)
+  serializer.load([row])
+  return FastJSONResponse(serializer.buildDict(row))
+
+@app.get("/incidents", response_model=Union[IncidentResponses, CompactIncidentResponses])
+def getIncidents(
+  filters: IncidentFilters = Depends(),
+  limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+  cursor: Optional[str] = None,
+  checkResponseFormat: CheckResponseFormat = "full",
+  db: Session = Depends(get_db)
+):
+  query = applyIncidentFilters(db.query(Incident), filters)
+  incidents, nextCursor = paginateIncidents(query, limit, cursor)
+  return FastJSONResponse(incidentListContent(incidents, nextCursor, db, checkResponseFormat))
+
+@app.get("/incidents/sync", response_model=Union[IncidentSyncResponse, CompactIncidentSyncResponse])
+def syncIncidentChanges(
+  cursor: Optional[str] = None,
+  factory_id: Optional[int] = None,
+  limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+  checkResponseFormat: CheckResponseFormat = "full",
+  db: Session = Depends(get_db)
+):
+  # Only what changed after `cursor`; without one, every incident from the start
+  incidents, deletedIds, nextCursor, hasMore = syncIncidents(db, cursor, limit, factory_id)
+  return FastJSONResponse(syncContent(incidents, deletedIds, nextCursor, hasMore, db, checkResponseFormat))
+
+@app.get("/incidents/live")
+async def streamIncidents(factory_id: Optional[int] = None, lastEventId: Optional[str] = Header(None, alias="Last-Event-ID")):
+  # Server-Sent Events of incidents as they are committed, see live_feed.py
+  incidentFeed.checkCapacity()
+  return StreamingResponse(
+    incidentFeed.stream(factory_id, lastEventId),
+    media_type="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+  )
 
 @app.post("/incidents", response_model=IncidentResponse)
-def addIncident(incident: IncidentBase, db: Session = Depends(get_db)):
+def addIncident(incident: IncidentInput, db: Session = Depends(get_db)):
   factory = db.query(Factory).filter(Factory.id == incident.factory_id).first()
   if factory is None:
     raise HTTPException(status_code=404, detail="Factory not found")
+  checkQuestionIds = referenceDataCache.ids(db, "checkQuestion", incident.check_responses)
+  if any(questionId not in checkQuestionIds for questionId in incident.check_responses):
+    raise HTTPException(status_code=404, detail="Check question not found")
 
-  new_Incident = Incident(**incident.model_dump())
+  new_Incident = Incident(**incident.model_dump(exclude={"check_responses"}))
   db.add(new_Incident)
+  # Assign the id so the check responses can be written in the same transaction
+  db.flush()
+  insertCheckResponses(db, {new_Incident.id: incident.check_responses})
   db.commit()
   db.refresh(new_Incident)
-  return convertIncidentToResponse(new_Incident, db)
-
-@app.get("/incidents/{incident_id}", response_model=IncidentResponse)
-def getIncident(incident_id: int, db: Session = Depends(get_db)):
+  incidentFeed.publish(new_Incident.factory_id, incidentEvent(new_Incident.id, incident.model_dump()))
+  return incidentJsonResponse(new_Incident, db)
+
+@app.post("/reports", response_model=Union[ReportAcknowledgement, IncidentResponse])
+def addReport(report: ReportInput, expand: bool = False, db: Session = Depends(get_db)):
+  # One request and one commit for what the report form used to send as POST /workers + POST /incidents
+  acknowledgement = submitReport(report, db)
+  if expand:
+    return incidentJsonResponse(db.get(Incident, acknowledgement.incident_id), db)
+  return acknowledgement
+
+@app.get("/incidents/export")
+def exportIncidents(
+  filters: IncidentFilters = Depends(),
+  format: Literal["ndjson", "csv"] = "ndjson",
+  checkResponseFormat: CheckResponseFormat = "full",
+  db: Session = Depends(get_db)
+):
+  query = applyIncidentFilters(db.query(Incident), filters).order_by(Incident.date.desc(), Incident.id.desc())
+  if format == "csv":
+    return StreamingResponse(
+      exportCsv(query, db),
+      media_type="text/csv",
+      headers={"Content-Disposition": 'attachment; filename="incidents.csv"'}
+    )
+  return StreamingResponse(
+    exportNdjson(query, db, checkResponseFormat),
+    media_type="application/x-ndjson",
+    headers={"Content-Disposition": 'attachment; filename="incidents.ndjson"'}
+  )
+
+@app.post("/incidents/bulk", response_model=BulkIncidentResult)
+async def addIncidentsBulk(request: Request, echo: bool = False, db: Session = Depends(get_db)):
+  items = parseBulkBody(await request.body(), request.headers.get("content-type", ""))
+  return await run_in_threadpool(ingestIncidents, items, db, echo)
+
+@app.get("/incidents/{incident_id}", response_model=Union[IncidentResponse, CompactIncidentResponse])
+def getIncident(incident_id: int, checkResponseFormat: CheckResponseFormat = "full", db: Session = Depends(get_db)):
   incident = db.query(Incident).filter(Incident.id == incident_id).first()
   if incident is None:
     raise HTTPException(status_code=404, detail="Incident not found")
-  return convertIncidentToResponse(incident, db)
-
-@app.get("/incidents/factory/{factory_id}", response_model=IncidentResponses)
-def getIncidentsByFactory(factory_id: int, db: Session = Depends(get_db)):
+  return incidentJsonResponse(incident, db, checkResponseFormat)
+
+@app.get("/incidents/factory/{factory_id}", response_model=Union[IncidentResponses, CompactIncidentResponses])
+def getIncidentsByFactory(
+  factory_id: int,
+  filters: IncidentFilters = Depends(),
+  # Paged only when asked to: existing clients read every incident of the factory from one response
+  limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+  cursor: Optional[str] = None,
+  checkResponseFormat: CheckResponseFormat = "full",
+  db: Session = Depends(get_db)
+):
   # Check if the factory exists
   factory = db.query(Factory).filter(Factory.id == factory_id).first()
   if factory is None:
     raise HTTPException(status_code=404, detail="Factory not found")
 
-  incidents = db.query(Incident).filter(Incident.factory_id == factory_id).all()
-  incidents = [convertIncidentToResponse(incident, db) for incident in incidents]
-  return IncidentResponses(incidents=incidents)
+  filters.factory_id = factory_id
+  query = applyIncidentFilters(db.query(Incident), filters)
+  incidents, nextCursor = paginateIncidents(query, limit, cursor)
+  return FastJSONResponse(incidentListContent(incidents, nextCursor, db, checkResponseFormat))
+
+@app.get("/referenceData", response_model=ReferenceDataResponse)
+def getReferenceData(request: Request, db: Session = Depends(get_db)):
+  # Everything the incident form needs, in one cached response
+  return referenceDataResponse(request, db, "referenceData")
 
 @app.get("/factories", response_model=FactoryResponses)
-def getFactories(db: Session = Depends(get_db)):
-  factories = db.query(Factory).all()
-  factoryResponses = []
-  for factory in factories:
-    try:
-      factoryResponse = convertDBModelintoResponseModel(factory, db)
-      factoryResponses.append(factoryResponse)
-    except HTTPException as e:
-      logger.error(f"{datetime.now()}: Error processing factory {factory.id}: {e.detail}")
-      # Skip this factory but continue processing others
-  return FactoryResponses(factories=factoryResponses)
+def getFactories(request: Request, db: Session = Depends(get_db)):
+  return referenceDataResponse(request, db, "factories")
 
 @app.get("/factories/{factory_id}", response_model=FactoryResponse)
 def getFactory(factory_id: int, db: Session = Depends(get_db)):
@@ -157,28 +226,24 @@ def getFactory(factory_id: int, db: Session = Depends(get_db)):
   if factory is None:
     raise HTTPException(status_code=404, detail="Factory not found")
 
-  return convertDBModelintoResponseModel(factory, db)
+  return rowJsonResponse(factory, db)
 
 @app.get("/threatTypes", response_model=ThreatTypeResponses)
-def getThreatTypes(db: Session = Depends(get_db)):
-  threatTypes = db.query(ThreatType).all()
-  return ThreatTypeResponses(threatTypes=[ThreatTypeResponse.model_validate(threatType) for threatType in threatTypes])
+def getThreatTypes(request: Request, db: Session = Depends(get_db)):
+  return referenceDataResponse(request, db, "threatTypes")
 
 @app.get("/workTypes", response_model=WorkTypeResponses)
-def getWorkTypes(db: Session = Depends(get_db)):
-  workTypes = db.query(WorkType).all()
-  return WorkTypeResponses(workTypes=[WorkTypeResponse.model_validate(workType) for workType in workTypes])
+def getWorkTypes(request: Request, db: Session = Depends(get_db)):
+  return referenceDataResponse(request, db, "workTypes")
 
 @app.get("/checks", response_model=CheckQuestionResponses)
-def getCheckQuestions(db: Session = Depends(get_db)):
-  checkQuestions = db.query(CheckQuestion).all()
-  return CheckQuestionResponses(checks=[CheckQuestionResponse.model_validate(checkQuestion) for checkQuestion in checkQuestions])
+def getCheckQuestions(request: Request, db: Session = Depends(get_db)):
+  return referenceDataResponse(request, db, "checks")
 
 @app.get("/workers", response_model=WorkerResponses)
 def getWorkers(db: Session = Depends(get_db)):
   workers = db.query(Worker).all()
-  workers = [convertDBModelintoResponseModel(worker, db) for worker in workers]
-  return WorkerResponses(workers=workers)
+  return FastJSONResponse({"workers": serializeRowDicts(workers, db)})
 
 @app.post("/workers", response_model=WorkerResponse)
 def addWorker(worker: WorkerInput, db: Session = Depends(get_db)):
@@ -186,37 +251,58 @@ def addWorker(worker: WorkerInput, db: Session = Depends(get_db)):
   db.add(new_Worker)
   db.commit()
   db.refresh(new_Worker)
-  return convertDBModelintoResponseModel(new_Worker, db)
+  return rowJsonResponse(new_Worker, db)
 
 @app.get("/industryTypes/large", response_model=IndustryTypeLargeResponses)
-def getIndustryTypesLarge(db: Session = Depends(get_db)):
-  industryTypesLarge = db.query(IndustryTypeLarge).all()
-  industryTypesLarge = [convertDBModelintoResponseModel(industryTypeLarge, db) for industryTypeLarge in industryTypesLarge]
-  return IndustryTypeLargeResponses(industryTypeLarge=industryTypesLarge)
+def getIndustryTypesLarge(request: Request, db: Session = Depends(get_db)):
+  return referenceDataResponse(request, db, "industryTypesLarge")
 
 @app.get("/industryTypes/medium", response_model=IndustryTypeMediumResponses)
-def getIndustryTypesMedium(db: Session = Depends(get_db)):
-  industryTypesMedium = db.query(IndustryTypeMedium).all()
-  industryTypesMedium = [convertDBModelintoResponseModel(industryTypeMedium, db) for industryTypeMedium in industryTypesMedium]
-  return IndustryTypeMediumResponses(industryTypeMedium=industryTypesMedium)
+def getIndustryTypesMedium(request: Request, db: Session = Depends(get_db)):
+  return referenceDataResponse(request, db, "industryTypesMedium")
 
 @app.get("/workforceSizeRanges", response_model=WorkforceSizeRangeResponses)
-def getWorkforceSizeRanges(db: Session = Depends(get_db)):
-  workforceSizeRanges = db.query(WorkforceSizeRange).all()
-  workforceSizeRanges = [convertDBModelintoResponseModel(workforceSizeRange, db) for workforceSizeRange in workforceSizeRanges]
-  return WorkforceSizeRangeResponses(workforceSizeRanges=workforceSizeRanges)
+def getWorkforceSizeRanges(request: Request, db: Session = Depends(get_db)):
+  return referenceDataResponse(request, db, "workforceSizeRanges")
 
 @app.get("/ageRanges", response_model=AgeRangeResponses)
-def getAgeRanges(db: Session = Depends(get_db)):
-  ageRanges = db.query(AgeRange).all()
-  ageRanges = [convertDBModelintoResponseModel(ageRange, db) for ageRange in ageRanges]
-  return AgeRangeResponses(ageRanges=ageRanges)
+def getAgeRanges(request: Request, db: Session = Depends(get_db)):
+  return referenceDataResponse(request, db, "ageRanges")
 
 @app.get("/workExperienceRanges", response_model=WorkExperienceRangeResponses)
-def getWorkExperienceRanges(db: Session = Depends(get_db)):
-  workExperienceRanges = db.query(WorkExperienceRange).all()
-  workExperienceRanges = [convertDBModelintoResponseModel(workExperienceRange, db) for workExperienceRange in workExperienceRanges]
-  return WorkExperienceRangeResponses(workExperienceRanges=workExperienceRanges)
+def getWorkExperienceRanges(request: Request, db: Session = Depends(get_db)):
+  return referenceDataResponse(request, db, "workExperienceRanges")
+
+@app.post("/admin/referenceData/reload")
+def reloadReferenceData(user: user_dependency, db: Session = Depends(get_db)):
+  referenceDataCache.invalidate()
+  referenceDataCache.load(db)
+  return referenceDataCache.stats()
+
+@app.get("/admin/referenceData/stats")
+def getReferenceDataStats(user: user_dependency):
+  return {**referenceDataCache.stats(), "responseBuilds": referenceResponseCache.builds}
+
+@app.get("/admin/passwordHashing/stats")
+def getPasswordHashingStats(user: user_dependency):
+  return passwordHasher.stats()
+
+@app.get("/metrics")
+def getMetrics():
+  content, contentType = renderMetrics()
+  return Response(content=content, media_type=contentType)
+
+@app.get("/admin/tokenCache/stats")
+def getTokenCacheStats(user: user_dependency):
+  return tokenCache.stats()
+
+@app.get("/admin/liveFeed/stats")
+def getLiveFeedStats(user: user_dependency):
+  return incidentFeed.stats()
+
+@app.get("/admin/idempotency/stats")
+def getIdempotencyStats(user: user_dependency):
+  return idempotencyStore.stats()
 
 if __name__ == "__main__":
   uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
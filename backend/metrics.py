@@ -0,0 +1,126 @@
+"""
+Prometheus metrics: request counts and latency by route template and status,
+SQL queries and time per request, connection pool checkout wait, and cache
+lookups (hit ratio = hits / all lookups).
+
+With several uvicorn workers, point PROMETHEUS_MULTIPROC_DIR at an empty
+directory before the workers start; each worker then writes its samples there
+and /metrics on any worker aggregates all of them.
+"""
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+
+from query_tracker import currentQueryTracker, recordQuery
+
+multiprocessDir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+queryCountBuckets = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+httpRequests = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+httpRequestDuration = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"])
+httpRequestQueries = Histogram("http_request_db_queries", "SQL statements executed per HTTP request", ["method", "route"], buckets=queryCountBuckets)
+httpRequestQueryDuration = Histogram("http_request_db_seconds", "Time spent in SQL per HTTP request", ["method", "route"])
+
+dbQueries = Counter("db_queries_total", "SQL statements executed", ["database"])
+dbQueryDuration = Histogram("db_query_duration_seconds", "SQL statement latency", ["database"])
+dbPoolCheckoutWait = Histogram("db_pool_checkout_wait_seconds", "Time waiting for a pooled connection", ["database"])
+dbPoolCheckedOut = Gauge("db_pool_checked_out_connections", "Connections currently checked out", ["database"], multiprocess_mode="livesum")
+
+cacheLookups = Counter("cache_lookups_total", "Cache lookups", ["cache", "result"])
+
+def recordCacheLookup(cache: str, hit: bool):
+  cacheLookups.labels(cache, "hit" if hit else "miss").inc()
+
+def instrumentEngine(engine, database: str):
+  """Count and time every statement and pool checkout on `engine`, labelled with `database`."""
+
+  @event.listens_for(engine, "before_cursor_execute")
+  def startQueryTimer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("queryStartTimes", []).append(time.perf_counter())
+
+  @event.listens_for(engine, "after_cursor_execute")
+  def recordStatement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["queryStartTimes"].pop()
+    dbQueries.labels(database).inc()
+    dbQueryDuration.labels(database).observe(elapsed)
+    # Adds the statement to the current request's QueryTracker
+    recordQuery(statement, parameters, elapsed)
+
+  @event.listens_for(engine, "checkout")
+  def countCheckout(dbapiConnection, connectionRecord, connectionProxy):
+    dbPoolCheckedOut.labels(database).inc()
+
+  @event.listens_for(engine, "checkin")
+  def countCheckin(dbapiConnection, connectionRecord):
+    dbPoolCheckedOut.labels(database).dec()
+
+  # The pool has no "before checkout" event, so time the checkout call itself,
+  # again on the new pool whenever engine.dispose() replaces it
+  timePoolCheckouts(engine.pool, database)
+
+  @event.listens_for(engine, "engine_disposed")
+  def timeRecreatedPool(disposedEngine):
+    timePoolCheckouts(disposedEngine.pool, database)
+
+def timePoolCheckouts(pool, database: str):
+  connect = pool.connect
+  def timedConnect():
+    started = time.perf_counter()
+    try:
+      return connect()
+    finally:
+      dbPoolCheckoutWait.labels(database).observe(time.perf_counter() - started)
+  pool.connect = timedConnect
+
+def renderMetrics() -> tuple[bytes, str]:
+  if multiprocessDir:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+  else:
+    registry = REGISTRY
+  return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def markProcessDead():
+  """Drop this worker's live gauges from the multiprocess directory on shutdown."""
+  if multiprocessDir:
+    multiprocess.mark_process_dead(os.getpid())
+
+class MetricsMiddleware:
+  """
+  Pure ASGI middleware recording request, latency and per-request SQL metrics.
+  Must run inside QueryTrackingMiddleware, whose tracker supplies the SQL figures.
+  """
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    startTime = time.monotonic()
+    statusCode = 500
+
+    async def sendWithStatus(message):
+      nonlocal statusCode
+      if message["type"] == "http.response.start":
+        statusCode = message["status"]
+      await send(message)
+
+    try:
+      await self.app(scope, receive, sendWithStatus)
+    finally:
+      # Label by the matched route template, never the raw path, to bound the number of series
+      route = scope.get("route")
+      routeName = route.path if route is not None else "unmatched"
+      method = scope["method"]
+      httpRequests.labels(method, routeName, str(statusCode)).inc()
+      httpRequestDuration.labels(method, routeName, str(statusCode)).observe(time.monotonic() - startTime)
+      tracker = currentQueryTracker.get()
+      if tracker is not None:
+        httpRequestQueries.labels(method, routeName).observe(tracker.count)
+        httpRequestQueryDuration.labels(method, routeName).observe(tracker.seconds)
@@ -0,0 +1,304 @@
+"""
+Versioned schema migrations for the application and auth databases.
+
+  python migrations.py status
+  python migrations.py upgrade
+"""
+import argparse
+import os
+
+from datetime import datetime
+from sqlalchemy import Boolean, CheckConstraint, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, bindparam, func, inspect, select, text, update
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+import db
+from auth import auth_db
+from incident_sync import nextChangeSequences, seedChangeSequence
+from risk_rollup import rebuildRiskRollupRows
+
+# Rows (or keys) handled per backfill transaction
+BACKFILL_BATCH_SIZE = int(os.getenv("MIGRATION_BACKFILL_BATCH_SIZE", "500"))
+
+# Arbitrary application-wide key for pg_advisory_xact_lock
+MIGRATION_LOCK_ID = 7345201
+
+migrationMetadata = MetaData()
+
+schemaMigrations = Table(
+  "schema_migrations",
+  migrationMetadata,
+  Column("version", String, primary_key=True),
+  Column("name", String),
+  Column("appliedAt", DateTime),
+)
+
+class Migration:
+  def __init__(self, version: str, name: str, upgrade, backfill=None):
+    self.version = version
+    self.name = name
+    # upgrade(connection): DDL and small data changes, run in one transaction
+    self.upgrade = upgrade
+    # backfill(engine): batched data changes, see backfillInBatches
+    self.backfill = backfill
+
+def migration(registry: list, version: str, name: str, backfill=None):
+  """Register the decorated upgrade function as a migration in `registry`."""
+  def register(upgrade):
+    registry.append(Migration(version, name, upgrade, backfill))
+    return upgrade
+  return register
+
+def lockDatabase(connection):
+  """Serialise schema changes across workers until the connection's transaction ends."""
+  if connection.dialect.name == "postgresql":
+    connection.execute(select(func.pg_advisory_xact_lock(MIGRATION_LOCK_ID)))
+  elif connection.dialect.name == "sqlite":
+    # Take the write lock up front; other workers wait up to busy_timeout
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+# Idempotent schema helpers for use in upgrades
+
+def createTable(connection, table: Table):
+  table.create(bind=connection, checkfirst=True)
+
+def createIndex(connection, index):
+  existingIndexes = {existing["name"] for existing in inspect(connection).get_indexes(index.table.name)}
+  if index.name not in existingIndexes:
+    index.create(bind=connection)
+
+def addColumn(connection, table: Table, column: Column):
+  """ALTER TABLE ... ADD COLUMN for a column declared on the model, as a nullable column."""
+  existingColumns = {existing["name"] for existing in inspect(connection).get_columns(table.name)}
+  if column.name in existingColumns:
+    return
+  alterStatement = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(connection.dialect)}"
+  if column.foreign_keys:
+    fk = next(iter(column.foreign_keys))
+    alterStatement += f" REFERENCES {fk.column.table.name}({fk.column.name})"
+  connection.execute(text(alterStatement))
+
+def backfillInBatches(engine, keys: list, apply, batchSize: int = None):
+  """Call apply(session, batch) for consecutive slices of `keys`, committing after each slice."""
+  batchSize = batchSize or BACKFILL_BATCH_SIZE
+  for start in range(0, len(keys), batchSize):
+    with Session(engine) as session:
+      apply(session, keys[start:start + batchSize])
+      session.commit()
+
+# Application database
+
+appMigrations = []
+
+# The application tables before versioned migrations. Frozen: schema changes go in new migrations.
+appBaselineMetadata = MetaData()
+
+for tableName in ["workforce_size_range", "age_range", "work_experience_range"]:
+  Table(
+    tableName,
+    appBaselineMetadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("range", String),
+  )
+
+for tableName in ["threat_type", "work_type", "industry_type_large", "industry_type_medium"]:
+  Table(
+    tableName,
+    appBaselineMetadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("name", String),
+  )
+
+Table(
+  "check_question",
+  appBaselineMetadata,
+  Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+  Column("question", String),
+)
+
+Table(
+  "factory",
+  appBaselineMetadata,
+  Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+  Column("name", String, unique=True),
+  Column("workforceSizeRange_id", Integer, ForeignKey("workforce_size_range.id")),
+)
+
+Table(
+  "worker",
+  appBaselineMetadata,
+  Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+  Column("name", String),
+  Column("ageRange_id", Integer, ForeignKey("age_range.id")),
+  Column("sex", String),
+  Column("workExperienceRange_id", Integer, ForeignKey("work_experience_range.id")),
+  CheckConstraint("sex in ('남', '여')", name="check_sex_values"),
+)
+
+Table(
+  "incident",
+  appBaselineMetadata,
+  Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+  Column("worker_id", Integer, ForeignKey("worker.id")),
+  Column("industryTypeLarge_id", Integer, ForeignKey("industry_type_large.id")),
+  Column("industryTypeMedium_id", Integer, ForeignKey("industry_type_medium.id")),
+  Column("threatType_id", Integer, ForeignKey("threat_type.id")),
+  Column("threatLevel", Integer),
+  Column("workType_id", Integer, ForeignKey("work_type.id")),
+  Column("description", String),
+  Column("date", DateTime),
+  Column("factory_id", Integer, ForeignKey("factory.id")),
+)
+
+Table(
+  "check_response",
+  appBaselineMetadata,
+  Column("question_id", Integer, ForeignKey("check_question.id"), primary_key=True, index=True),
+  Column("incident_id", Integer, ForeignKey("incident.id"), primary_key=True, index=True),
+  Column("response", Boolean),
+)
+
+@migration(appMigrations, "0001", "baseline")
+def createBaseline(connection):
+  appBaselineMetadata.create_all(bind=connection)
+
+@migration(appMigrations, "0002", "incident keyset pagination indexes")
+def createIncidentIndexes(connection):
+  for index in db.Incident.__table__.indexes:
+    # The changeSeq indexes come with their column in 0006
+    if "changeSeq" not in index.columns:
+      createIndex(connection, index)
+
+def backfillRiskRollup(engine):
+  with Session(engine) as session:
+    factoryIds = session.scalars(
+      select(db.Incident.factory_id).where(db.Incident.factory_id.isnot(None)).distinct().order_by(db.Incident.factory_id)
+    ).all()
+  # A few factories per transaction keeps each one to a slice of the incident table
+  backfillInBatches(engine, factoryIds, rebuildRiskRollupRows, batchSize=10)
+
+@migration(appMigrations, "0003", "factory_risk_rollup", backfill=backfillRiskRollup)
+def createRiskRollup(connection):
+  createTable(connection, db.FactoryRiskRollup.__table__)
+
+@migration(appMigrations, "0004", "bootstrap_state")
+def createBootstrapState(connection):
+  createTable(connection, db.BootstrapState.__table__)
+
+@migration(appMigrations, "0005", "idempotency_key")
+def createIdempotencyKey(connection):
+  createTable(connection, db.IdempotencyKey.__table__)
+
+def stampIncidentBatch(session, incidentIds):
+  incidentTable = db.Incident.__table__
+  connection = session.connection()
+  connection.execute(
+    update(incidentTable).where(incidentTable.c.id == bindparam("incidentId")).values(changeSeq=bindparam("changeSeq")),
+    [{"incidentId": incidentId, "changeSeq": changeSeq} for incidentId, changeSeq in zip(incidentIds, nextChangeSequences(connection, len(incidentIds)))]
+  )
+
+def backfillChangeSequence(engine):
+  with Session(engine) as session:
+    incidentIds = session.scalars(select(db.Incident.id).where(db.Incident.changeSeq.is_(None)).order_by(db.Incident.id)).all()
+  backfillInBatches(engine, incidentIds, stampIncidentBatch)
+
+@migration(appMigrations, "0006", "incident change sequence", backfill=backfillChangeSequence)
+def createChangeSequence(connection):
+  addColumn(connection, db.Incident.__table__, db.Incident.__table__.c.changeSeq)
+  for index in db.Incident.__table__.indexes:
+    if "changeSeq" in index.columns:
+      createIndex(connection, index)
+  createTable(connection, db.IncidentTombstone.__table__)
+  createTable(connection, db.ChangeSequence.__table__)
+  # Seeded here rather than by the first write, so concurrent first writes never both insert it
+  seedChangeSequence(connection)
+
+# Auth database
+
+authMigrations = []
+
+# The auth tables before versioned migrations. Frozen, as appBaselineMetadata.
+authBaselineMetadata = MetaData()
+
+Table(
+  "users",
+  authBaselineMetadata,
+  Column("username", String, primary_key=True),
+  Column("hashed_password", String),
+)
+
+@migration(authMigrations, "0001", "baseline")
+def createAuthBaseline(connection):
+  authBaselineMetadata.create_all(bind=connection)
+
+databases = {
+  "app": (db.engine, appMigrations),
+  "auth": (auth_db.engine, authMigrations),
+}
+
+def appliedVersions(connection) -> dict:
+  """version -> appliedAt of the recorded migrations; empty before the first migration."""
+  try:
+    return dict(connection.execute(select(schemaMigrations.c.version, schemaMigrations.c.appliedAt)).all())
+  except (OperationalError, ProgrammingError):
+    # schema_migrations does not exist yet
+    connection.rollback()
+    return {}
+
+def pendingMigrations(engine, migrations: list) -> list[Migration]:
+  with engine.connect() as connection:
+    applied = appliedVersions(connection)
+  return [migration for migration in migrations if migration.version not in applied]
+
+def recordMigration(connection, migration: Migration):
+  if migration.version not in appliedVersions(connection):
+    connection.execute(schemaMigrations.insert().values(
+      version=migration.version, name=migration.name, appliedAt=datetime.now()
+    ))
+
+def migrateDatabase(engine, migrations: list) -> list[Migration]:
+  """Apply the pending `migrations` in order. Returns the migrations that were applied."""
+  applied = []
+  for migration in pendingMigrations(engine, migrations):
+    with engine.connect() as connection:
+      lockDatabase(connection)
+      createTable(connection, schemaMigrations)
+      if migration.version in appliedVersions(connection):
+        # Another worker applied it while this one waited for the lock
+        continue
+      print(f"Applying migration {migration.version} {migration.name}")
+      migration.upgrade(connection)
+      if migration.backfill is None:
+        recordMigration(connection, migration)
+      connection.commit()
+
+    if migration.backfill is not None:
+      migration.backfill(engine)
+      with engine.connect() as connection:
+        lockDatabase(connection)
+        recordMigration(connection, migration)
+        connection.commit()
+    applied.append(migration)
+  return applied
+
+def migrateAll():
+  for engine, migrations in databases.values():
+    migrateDatabase(engine, migrations)
+
+def printStatus():
+  for databaseName, (engine, migrations) in databases.items():
+    with engine.connect() as connection:
+      applied = appliedVersions(connection)
+    print(f"{databaseName} ({engine.url.render_as_string(hide_password=True)})")
+    for migration in migrations:
+      appliedAt = applied.get(migration.version)
+      state = f"applied {appliedAt.isoformat(timespec='seconds')}" if appliedAt else "pending"
+      print(f"  {migration.version} {migration.name}: {state}")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Apply or list schema migrations")
+  parser.add_argument("command", choices=["status", "upgrade"])
+  args = parser.parse_args()
+  if args.command == "upgrade":
+    migrateAll()
+  printStatus()
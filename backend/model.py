@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Literal, Optional, List
 
 class WorkforceSizeRangeResponse(BaseModel):
   id: int
@@ -108,10 +108,23 @@ class CheckQuestionResponse(BaseModel):
 
   class Config:
     from_attributes = True
+    # Hashable, since it is used as the key of IncidentResponse.check_responses
+    frozen = True
 
 class CheckQuestionResponses(BaseModel):
   checks: List[CheckQuestionResponse]
 
+class ReferenceDataResponse(BaseModel):
+  factories: List[FactoryResponse]
+  threatTypes: List[ThreatTypeResponse]
+  workTypes: List[WorkTypeResponse]
+  checks: List[CheckQuestionResponse]
+  ageRanges: List[AgeRangeResponse]
+  workExperienceRanges: List[WorkExperienceRangeResponse]
+  industryTypeLarge: List[IndustryTypeLargeResponse]
+  industryTypeMedium: List[IndustryTypeMediumResponse]
+  workforceSizeRanges: List[WorkforceSizeRangeResponse]
+
 class IncidentBase(BaseModel):
   worker_id: int
   industryTypeLarge_id: int
@@ -124,7 +137,8 @@ class IncidentBase(BaseModel):
   factory_id: int
 
 class IncidentInput(IncidentBase):
-  check_responses: dict[int, bool]
+  # question id -> response
+  check_responses: dict[int, bool] = {}
 
 class IncidentResponse(BaseModel):
   id: int
@@ -137,10 +151,129 @@ class IncidentResponse(BaseModel):
   description: str
   date: datetime
   factory: FactoryResponse
-  check_responses: dict[CheckQuestionResponse, str]
+  check_responses: dict[CheckQuestionResponse, bool]
+
+# "full": check_responses maps each question (serialized as its text) to the answer.
+# "compact": check_responses lists {question_id, response}; list responses carry the question catalog once.
+CheckResponseFormat = Literal["full", "compact"]
+
+class CheckResponseEntry(BaseModel):
+  question_id: int
+  response: bool
+
+class CompactIncidentResponse(IncidentResponse):
+  check_responses: List[CheckResponseEntry]
+
+class ReportInput(BaseModel):
+  # The reporting worker, created in the same transaction as the incident
+  worker: WorkerInput
+  industryTypeLarge_id: int
+  industryTypeMedium_id: int
+  threatType_id: int
+  threatLevel: int
+  workType_id: int
+  description: str
+  date: datetime
+  factory_id: int
+  # question id -> response
+  check_responses: dict[int, bool] = {}
+
+class ReportAcknowledgement(BaseModel):
+  incident_id: int
+  worker_id: int
+
+class BulkIncidentError(BaseModel):
+  index: int
+  detail: str
+
+class BulkIncidentResult(BaseModel):
+  # Aligned with the submitted rows; None where the row was rejected
+  ids: List[Optional[int]]
+  errors: List[BulkIncidentError]
+  incidents: Optional[List[IncidentResponse]] = None
 
 class IncidentResponses(BaseModel):
   incidents: List[IncidentResponse]
+  nextCursor: Optional[str] = None
+
+class CompactIncidentResponses(BaseModel):
+  incidents: List[CompactIncidentResponse]
+  nextCursor: Optional[str] = None
+  checkQuestions: List[CheckQuestionResponse]
+
+class IncidentSyncResponse(BaseModel):
+  # Created or updated since the cursor, in change order
+  incidents: List[IncidentResponse]
+  # Ids of incidents deleted since the cursor (or moved out of the requested factory)
+  deleted: List[int]
+  # Send as `cursor` on the next sync
+  cursor: str
+  # More changes follow; sync again with `cursor` right away
+  hasMore: bool
+
+class CompactIncidentSyncResponse(BaseModel):
+  incidents: List[CompactIncidentResponse]
+  deleted: List[int]
+  cursor: str
+  hasMore: bool
+  checkQuestions: List[CheckQuestionResponse]
+
+class IncidentFilters(BaseModel):
+  dateFrom: Optional[datetime] = None
+  dateTo: Optional[datetime] = None
+  factory_id: Optional[int] = None
+  threatType_id: Optional[int] = None
+  workType_id: Optional[int] = None
+  worker_id: Optional[int] = None
+  threatLevelMin: Optional[int] = None
+  threatLevelMax: Optional[int] = None
+
+class ThreatTypeCount(BaseModel):
+  threatType: ThreatTypeResponse
+  count: int
 
+class ThreatTypeCounts(BaseModel):
+  counts: List[ThreatTypeCount]
 
+class FactoryThreatTypeCount(BaseModel):
+  factory_id: int
+  factory: str
+  threatType: ThreatTypeResponse
+  count: int
+
+class FactoryThreatTypeCounts(BaseModel):
+  counts: List[FactoryThreatTypeCount]
+
+class FactoryMonthlyCount(BaseModel):
+  factory_id: int
+  factory: str
+  month: str
+  count: int
+  averageThreatLevel: float
 
+class FactoryMonthlyCounts(BaseModel):
+  counts: List[FactoryMonthlyCount]
+
+class FactoryRiskIndex(BaseModel):
+  factory_id: int
+  factory: str
+  incidentCount: int
+  threatLevelSum: int
+  threatLevelMax: int
+  riskScore: float
+  riskIndex: float
+
+class FactoryRiskIndexes(BaseModel):
+  factories: List[FactoryRiskIndex]
+
+class FactoryMonthlyRisk(BaseModel):
+  factory_id: int
+  factory: str
+  month: str
+  incidentCount: int
+  threatLevelSum: int
+  threatLevelMax: int
+  riskScore: float
+
+class FactoryMonthlyRisks(BaseModel):
+  months: List[FactoryMonthlyRisk]
@@ -0,0 +1,105 @@
+"""
+Request-scoped SQL accounting for spotting N+1 query patterns.
+
+metrics.instrumentEngine reports every statement to recordQuery, which adds it
+to the tracker of the current request (a contextvar, so statements run from
+threadpool endpoints count too). QueryTrackingMiddleware logs a warning with
+the slowest statements when a request runs more than QUERY_BUDGET statements,
+and any single statement slower than SLOW_QUERY_MS is logged as it happens.
+With QUERY_TRACKER_HEADERS=1 (for development) responses carry X-Query-Count
+and X-Query-Time-Ms, counted up to the moment the response starts.
+"""
+import contextvars
+import heapq
+import logging
+import os
+
+from contextlib import contextmanager
+
+from db_engine import envFlag
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "50"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+QUERY_TRACKER_HEADERS = envFlag("QUERY_TRACKER_HEADERS", False)
+# Slowest statements kept per request, and how much of each statement/parameters is logged
+SLOWEST_KEPT = 5
+LOGGED_TEXT_LENGTH = 500
+
+def truncate(value) -> str:
+  text = str(value)
+  return text if len(text) <= LOGGED_TEXT_LENGTH else text[:LOGGED_TEXT_LENGTH] + "..."
+
+class QueryTracker:
+  def __init__(self):
+    self.count = 0
+    self.seconds = 0.0
+    # Min-heap of (seconds, order, statement, parameters) holding the slowest statements
+    self.slowest = []
+
+  def record(self, statement: str, parameters, seconds: float):
+    self.count += 1
+    self.seconds += seconds
+    entry = (seconds, self.count, statement, parameters)
+    if len(self.slowest) < SLOWEST_KEPT:
+      heapq.heappush(self.slowest, entry)
+    elif seconds > self.slowest[0][0]:
+      heapq.heapreplace(self.slowest, entry)
+
+  def slowestStatements(self) -> list[dict]:
+    return [
+      {"ms": round(seconds * 1000, 3), "statement": truncate(statement), "parameters": truncate(parameters)}
+      for seconds, _, statement, parameters in sorted(self.slowest, reverse=True)
+    ]
+
+currentQueryTracker = contextvars.ContextVar("currentQueryTracker", default=None)
+
+def recordQuery(statement: str, parameters, seconds: float):
+  tracker = currentQueryTracker.get()
+  if tracker is not None:
+    tracker.record(statement, parameters, seconds)
+  if seconds * 1000 >= SLOW_QUERY_MS:
+    logger.warning("Slow query", extra={"ms": round(seconds * 1000, 3), "statement": truncate(statement), "parameters": truncate(parameters)})
+
+@contextmanager
+def trackQueries():
+  """Track the statements run in this context, e.g. a script or a direct function call in a test."""
+  tracker = QueryTracker()
+  token = currentQueryTracker.set(tracker)
+  try:
+    yield tracker
+  finally:
+    currentQueryTracker.reset(token)
+
+class QueryTrackingMiddleware:
+  """Pure ASGI middleware giving every HTTP request its own QueryTracker and enforcing QUERY_BUDGET."""
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    async def sendWithQueryHeaders(message):
+      if message["type"] == "http.response.start":
+        message["headers"] = list(message.get("headers", [])) + [
+          (b"x-query-count", str(tracker.count).encode()),
+          (b"x-query-time-ms", f"{tracker.seconds * 1000:.3f}".encode()),
+        ]
+      await send(message)
+
+    with trackQueries() as tracker:
+      await self.app(scope, receive, sendWithQueryHeaders if QUERY_TRACKER_HEADERS else send)
+
+    if tracker.count > QUERY_BUDGET:
+      logger.warning("Query budget exceeded", extra={
+        "method": scope["method"],
+        "path": scope["path"],
+        "queryCount": tracker.count,
+        "queryBudget": QUERY_BUDGET,
+        "queryMs": round(tracker.seconds * 1000, 3),
+        "slowest": tracker.slowestStatements(),
+      })
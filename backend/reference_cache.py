@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+import time
+
+from datetime import datetime
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from metrics import recordCacheLookup
+from db import Factory, ThreatType, WorkType, CheckQuestion, AgeRange, WorkExperienceRange, IndustryTypeLarge, IndustryTypeMedium, WorkforceSizeRange
+from model import ThreatTypeResponse, WorkTypeResponse, CheckQuestionResponse, AgeRangeResponse, WorkExperienceRangeResponse, IndustryTypeLargeResponse, IndustryTypeMediumResponse, WorkforceSizeRangeResponse
+
+logger = logging.getLogger("fastapi")
+
+# How long an id still unknown after a reload is taken as missing without reloading again
+REFERENCE_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("REFERENCE_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+
+# Lookup tables seeded from backend/resources, keyed by the same varName used in `*_id` columns
+referenceModels = {
+  "threatType": (ThreatType, ThreatTypeResponse),
+  "workType": (WorkType, WorkTypeResponse),
+  "checkQuestion": (CheckQuestion, CheckQuestionResponse),
+  "ageRange": (AgeRange, AgeRangeResponse),
+  "workExperienceRange": (WorkExperienceRange, WorkExperienceRangeResponse),
+  "industryTypeLarge": (IndustryTypeLarge, IndustryTypeLargeResponse),
+  "industryTypeMedium": (IndustryTypeMedium, IndustryTypeMediumResponse),
+  "workforceSizeRange": (WorkforceSizeRange, WorkforceSizeRangeResponse),
+}
+
+referenceTableNames = {model.__tablename__ for model, _ in referenceModels.values()}
+# Writes to these bump `version`: the lookup tables, plus factory, which is not cached here
+# but is part of the reference data responses built from `version` (reference_responses.py)
+versionedTableNames = referenceTableNames | {Factory.__tablename__}
+
+class ReferenceDataCache:
+  """
+  Process-wide cache of the lookup tables as prebuilt response models keyed by id.
+  Any committed write to a lookup table (or to factory) bumps `version`, and the
+  next read reloads every table. An unknown id also forces a reload so rows added
+  by another worker process become visible; an id still unknown afterwards (a
+  dangling foreign key) is remembered as missing until the next version bump or
+  for REFERENCE_CACHE_NEGATIVE_TTL_SECONDS, so it costs one reload, not one per lookup.
+
+  The Session events below only see commits made in this process. Writes by another
+  worker are picked up by those unknown-id reloads, which bump `version` when the
+  tables changed, or by POST /admin/referenceData/reload.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    # varName -> {id: response model}, ordered by id
+    self.entries = None
+    self.version = 0
+    self.loadedVersion = -1
+    # (varName, id) -> time.monotonic() until which the id is known to be missing
+    self.unknownIds = {}
+    self.hits = 0
+    self.misses = 0
+    self.reloads = 0
+
+  def invalidate(self):
+    with self.lock:
+      self.version += 1
+      self.unknownIds.clear()
+
+  def isStale(self) -> bool:
+    return self.entries is None or self.loadedVersion != self.version
+
+  def load(self, db: Session):
+    with self.lock:
+      version = self.version
+      entries = {}
+      for varName, (model, responseModel) in referenceModels.items():
+        rows = db.query(model).order_by(model.id).all()
+        entries[varName] = {row.id: responseModel.model_validate(row) for row in rows}
+      if self.entries is not None and version == self.loadedVersion and entries != self.entries:
+        # Rows written by another process: responses built from `version` are out of date too
+        self.version += 1
+        version = self.version
+      self.entries = entries
+      self.loadedVersion = version
+      self.reloads += 1
+    logger.info(f"{datetime.now()}: Reference data cache loaded (version {version})")
+
+  def ensureLoaded(self, db: Session):
+    if self.isStale():
+      self.misses += 1
+      recordCacheLookup("referenceData", False)
+      self.load(db)
+    else:
+      self.hits += 1
+      recordCacheLookup("referenceData", True)
+
+  def getAll(self, db: Session, varName: str) -> list:
+    self.ensureLoaded(db)
+    return list(self.entries[varName].values())
+
+  def resolveMissing(self, db: Session, varName: str, missingIds):
+    """Reload once for ids not in the cache, unless they were all found missing recently."""
+    now = time.monotonic()
+    if all(self.unknownIds.get((varName, id), 0) > now for id in missingIds):
+      self.hits += 1
+      recordCacheLookup("referenceData", True)
+      return
+    # Possibly added by another process since the last load
+    self.misses += 1
+    recordCacheLookup("referenceData", False)
+    self.load(db)
+    with self.lock:
+      if self.loadedVersion != self.version:
+        # Invalidated during the load; the next read reloads anyway
+        return
+      self.unknownIds = {key: expiresAt for key, expiresAt in self.unknownIds.items() if expiresAt > now}
+      for id in missingIds:
+        if id not in self.entries[varName]:
+          self.unknownIds[(varName, id)] = now + REFERENCE_CACHE_NEGATIVE_TTL_SECONDS
+
+  def get(self, db: Session, varName: str, id: int):
+    self.ensureLoaded(db)
+    entry = self.entries[varName].get(id)
+    if entry is None and id is not None:
+      self.resolveMissing(db, varName, [id])
+      entry = self.entries[varName].get(id)
+    return entry
+
+  def ids(self, db: Session, varName: str, wanted=()) -> set:
+    """The ids of `varName`; any of `wanted` not among them is looked up as in get()."""
+    self.ensureLoaded(db)
+    missingIds = {id for id in wanted if id is not None and id not in self.entries[varName]}
+    if missingIds:
+      self.resolveMissing(db, varName, missingIds)
+    return set(self.entries[varName])
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "reloads": self.reloads,
+      "hitRatio": self.hits / lookups if lookups else 0.0,
+      "version": self.version,
+      "loaded": not self.isStale(),
+      "unknownIds": len(self.unknownIds),
+    }
+
+referenceDataCache = ReferenceDataCache()
+
+# Invalidate the cache whenever a committed transaction touched a lookup table
+@event.listens_for(Session, "after_flush")
+def markReferenceDataFlush(session, flushContext):
+  for instance in chain(session.new, session.dirty, session.deleted):
+    if getattr(instance, "__tablename__", None) in versionedTableNames:
+      session.info["referenceDataChanged"] = True
+      return
+
+@event.listens_for(Session, "do_orm_execute")
+def markReferenceDataStatement(ormExecuteState):
+  if not (ormExecuteState.is_insert or ormExecuteState.is_update or ormExecuteState.is_delete):
+    return
+  table = getattr(ormExecuteState.statement, "table", None)
+  if getattr(table, "name", None) in versionedTableNames:
+    ormExecuteState.session.info["referenceDataChanged"] = True
+
+@event.listens_for(Session, "after_commit")
+def invalidateReferenceDataOnCommit(session):
+  if session.info.pop("referenceDataChanged", False):
+    referenceDataCache.invalidate()
+
+@event.listens_for(Session, "after_soft_rollback")
+def clearReferenceDataFlag(session, previousTransaction):
+  session.info.pop("referenceDataChanged", None)
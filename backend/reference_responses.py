@@ -0,0 +1,102 @@
+"""
+Encoded bodies of the reference data endpoints, rebuilt once per reference data
+version and served with a content-hash ETag.
+"""
+import hashlib
+import logging
+import os
+import threading
+
+from datetime import datetime
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+
+from db import Factory
+from reference_cache import referenceDataCache
+from serialization import BatchSerializer, dumpJson
+
+logger = logging.getLogger("fastapi")
+
+# Seconds clients may reuse a response without revalidating; 0 sends no-cache (always revalidate, usually a 304)
+REFERENCE_DATA_MAX_AGE = int(os.getenv("REFERENCE_DATA_MAX_AGE", "0"))
+
+def lookupDicts(db: Session, varName: str) -> list[dict]:
+  return [entry.model_dump() for entry in referenceDataCache.getAll(db, varName)]
+
+def factoryDicts(db: Session) -> list[dict]:
+  factories = db.query(Factory).order_by(Factory.id).all()
+  serializer = BatchSerializer(db)
+  serializer.load(factories)
+  factoryResponses = []
+  for factory in factories:
+    try:
+      factoryResponses.append(serializer.buildDict(factory))
+    except HTTPException as e:
+      logger.error(f"{datetime.now()}: Error processing factory {factory.id}: {e.detail}")
+      # Skip this factory but continue processing others
+  return factoryResponses
+
+# Response name -> (top-level key, function building its list)
+referenceLists = {
+  "factories": ("factories", factoryDicts),
+  "threatTypes": ("threatTypes", lambda db: lookupDicts(db, "threatType")),
+  "workTypes": ("workTypes", lambda db: lookupDicts(db, "workType")),
+  "checks": ("checks", lambda db: lookupDicts(db, "checkQuestion")),
+  "ageRanges": ("ageRanges", lambda db: lookupDicts(db, "ageRange")),
+  "workExperienceRanges": ("workExperienceRanges", lambda db: lookupDicts(db, "workExperienceRange")),
+  "industryTypesLarge": ("industryTypeLarge", lambda db: lookupDicts(db, "industryTypeLarge")),
+  "industryTypesMedium": ("industryTypeMedium", lambda db: lookupDicts(db, "industryTypeMedium")),
+  "workforceSizeRanges": ("workforceSizeRanges", lambda db: lookupDicts(db, "workforceSizeRange")),
+}
+
+def buildContent(db: Session, name: str) -> dict:
+  if name == "referenceData":
+    return {key: build(db) for key, build in referenceLists.values()}
+  key, build = referenceLists[name]
+  return {key: build(db)}
+
+class ReferenceResponseCache:
+  """name -> (version, body, ETag) for the responses in referenceLists plus the "referenceData" bundle."""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.bodies = {}
+    self.builds = 0
+
+  def get(self, db: Session, name: str) -> tuple[bytes, str]:
+    referenceDataCache.ensureLoaded(db)
+    # Read before building: a write committed meanwhile bumps the version and forces another rebuild
+    version = referenceDataCache.version
+    cached = self.bodies.get(name)
+    if cached is not None and cached[0] == version:
+      return cached[1], cached[2]
+
+    body = dumpJson(buildContent(db, name))
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    with self.lock:
+      self.bodies[name] = (version, body, etag)
+      self.builds += 1
+    return body, etag
+
+referenceResponseCache = ReferenceResponseCache()
+
+def etagMatches(ifNoneMatch: str, etag: str) -> bool:
+  """If-None-Match uses the weak comparison, so W/ prefixes are ignored."""
+  if ifNoneMatch is None:
+    return False
+  if ifNoneMatch.strip() == "*":
+    return True
+  candidates = [candidate.strip() for candidate in ifNoneMatch.split(",")]
+  return etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+
+def referenceDataResponse(request: Request, db: Session, name: str) -> Response:
+  """The cached body of `name`, or 304 Not Modified when the client already has it."""
+  body, etag = referenceResponseCache.get(db, name)
+  headers = {
+    "ETag": etag,
+    "Cache-Control": f"max-age={REFERENCE_DATA_MAX_AGE}" if REFERENCE_DATA_MAX_AGE > 0 else "no-cache",
+  }
+  if etagMatches(request.headers.get("if-none-match"), etag):
+    return Response(status_code=304, headers=headers)
+  return Response(content=body, media_type="application/json", headers=headers)
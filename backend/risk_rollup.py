@@ -0,0 +1,143 @@
+import os
+
+from sqlalchemy import case, event, func, insert, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, Incident, FactoryRiskRollup
+from incident_query import monthOf
+
+def parseRiskLevelWeights(value: str) -> dict[int, float]:
+  """Parse a RISK_LEVEL_WEIGHTS value such as "1:1,2:2,3:4,4:8,5:16"."""
+  weights = {}
+  for pair in value.split(","):
+    if pair.strip():
+      level, weight = pair.split(":")
+      weights[int(level)] = float(weight)
+  return weights
+
+# threatLevel -> weight added to riskScore. Levels without a weight count as their own value.
+riskLevelWeights = parseRiskLevelWeights(os.getenv("RISK_LEVEL_WEIGHTS", ""))
+
+def riskWeight(threatLevel: int) -> float:
+  return riskLevelWeights.get(threatLevel, threatLevel or 0)
+
+def riskWeightExpression():
+  if not riskLevelWeights:
+    return func.coalesce(Incident.threatLevel, 0)
+  return case(riskLevelWeights, value=Incident.threatLevel, else_=func.coalesce(Incident.threatLevel, 0))
+
+def recordIncidents(db: Session, incidents: list[Incident]):
+  """
+  Fold new incidents into factory_risk_rollup within the caller's transaction,
+  with one upsert per (factory, month) touched. ORM inserts are folded in by
+  maintainRiskRollup; Core inserts of incidents must call this themselves.
+  """
+  deltas = {}
+  for incident in incidents:
+    if incident.factory_id is None or incident.date is None:
+      continue
+    key = (incident.factory_id, incident.date.strftime("%Y-%m"))
+    delta = deltas.setdefault(key, {"incidentCount": 0, "threatLevelSum": 0, "threatLevelMax": 0, "riskScore": 0.0})
+    threatLevel = incident.threatLevel or 0
+    delta["incidentCount"] += 1
+    delta["threatLevelSum"] += threatLevel
+    delta["threatLevelMax"] = max(delta["threatLevelMax"], threatLevel)
+    delta["riskScore"] += riskWeight(incident.threatLevel)
+  if not deltas:
+    return
+
+  table = FactoryRiskRollup.__table__
+  if db.get_bind().dialect.name == "postgresql":
+    statement = postgresql.insert(table)
+    greatest = func.greatest
+  else:
+    statement = sqlite.insert(table)
+    greatest = func.max
+  statement = statement.on_conflict_do_update(
+    index_elements=[table.c.factory_id, table.c.month],
+    set_={
+      "incidentCount": table.c.incidentCount + statement.excluded.incidentCount,
+      "threatLevelSum": table.c.threatLevelSum + statement.excluded.threatLevelSum,
+      "threatLevelMax": greatest(table.c.threatLevelMax, statement.excluded.threatLevelMax),
+      "riskScore": table.c.riskScore + statement.excluded.riskScore,
+    }
+  )
+  db.execute(statement, [
+    {"factory_id": factory_id, "month": month, **delta}
+    for (factory_id, month), delta in deltas.items()
+  ])
+
+def rebuildRiskRollupRows(db: Session, factoryIds: list[int] = None):
+  """
+  Recompute the factory_risk_rollup rows of every factory, or of `factoryIds`,
+  within the caller's transaction.
+  """
+  table = FactoryRiskRollup.__table__
+  month = monthOf(Incident.date, db)
+  aggregate = (
+    db.query(
+      Incident.factory_id,
+      month,
+      func.count(Incident.id),
+      func.coalesce(func.sum(Incident.threatLevel), 0),
+      func.coalesce(func.max(Incident.threatLevel), 0),
+      func.coalesce(func.sum(riskWeightExpression()), 0),
+    )
+    .filter(Incident.factory_id.isnot(None), Incident.date.isnot(None))
+    .group_by(Incident.factory_id, month)
+  )
+  delete = table.delete()
+  if factoryIds is not None:
+    aggregate = aggregate.filter(Incident.factory_id.in_(factoryIds))
+    delete = delete.where(table.c.factory_id.in_(factoryIds))
+  db.execute(delete)
+  db.execute(insert(table).from_select(
+    ["factory_id", "month", "incidentCount", "threatLevelSum", "threatLevelMax", "riskScore"],
+    aggregate.statement
+  ))
+
+# Columns an incident's rollup row depends on
+ROLLUP_ATTRIBUTES = ("factory_id", "date", "threatLevel")
+
+@event.listens_for(Session, "after_flush")
+def maintainRiskRollup(session, flushContext):
+  """
+  Keep factory_risk_rollup current for incidents written through the ORM, in the
+  same transaction: new ones are folded in, and updated or deleted ones rebuild
+  the rows of their old and new factory.
+  """
+  factoryIds = set()
+  for instance in session.deleted:
+    if isinstance(instance, Incident):
+      factoryIds.add(instance.factory_id)
+      factoryIds.update(inspect(instance).attrs.factory_id.history.deleted)
+  for instance in session.dirty:
+    if not isinstance(instance, Incident):
+      continue
+    attrs = inspect(instance).attrs
+    if any(attrs[name].history.has_changes() for name in ROLLUP_ATTRIBUTES):
+      factoryIds.add(instance.factory_id)
+      factoryIds.update(attrs.factory_id.history.deleted)
+  factoryIds.discard(None)
+  if factoryIds:
+    rebuildRiskRollupRows(session, sorted(factoryIds))
+  # The rebuild already counted new incidents of those factories
+  recordIncidents(session, [
+    instance for instance in session.new
+    if isinstance(instance, Incident) and instance.factory_id not in factoryIds
+  ])
+
+def rebuildRiskRollup(db: Session, factoryIds: list[int] = None) -> int:
+  """
+  Recompute factory_risk_rollup and commit; returns its row count.
+  Use after backfills or weight changes.
+  """
+  rebuildRiskRollupRows(db, factoryIds)
+  db.commit()
+  return db.query(FactoryRiskRollup).count()
+
+if __name__ == "__main__":
+  with SessionLocal() as db:
+    rowCount = rebuildRiskRollup(db)
+  print(f"Rebuilt factory_risk_rollup: {rowCount} rows")
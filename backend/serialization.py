@@ -0,0 +1,286 @@
+import json
+import logging
+
+from collections import defaultdict
+from datetime import datetime
+from functools import cache
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from db import Incident, Factory, ThreatType, WorkType, CheckQuestion, CheckResponse, AgeRange, WorkExperienceRange, IndustryTypeLarge, IndustryTypeMedium, WorkforceSizeRange, Worker
+from model import CheckResponseFormat, IncidentResponse, FactoryResponse, ThreatTypeResponse, WorkTypeResponse, CheckQuestionResponse, AgeRangeResponse, WorkExperienceRangeResponse, IndustryTypeLargeResponse, IndustryTypeMediumResponse, WorkforceSizeRangeResponse, WorkerResponse
+from reference_cache import referenceDataCache, referenceModels
+
+try:
+  import orjson
+except ImportError:
+  # Optional: the standard library encoder produces the same bytes, more slowly
+  orjson = None
+
+logger = logging.getLogger("fastapi")
+
+# Keep IN lists well below SQLite's bound parameter limit
+IN_CLAUSE_CHUNK_SIZE = 500
+
+varNameToModel = {
+  "incident": Incident,
+  "factory": Factory,
+  "threatType": ThreatType,
+  "workType": WorkType,
+  "checkQuestion": CheckQuestion,
+  "ageRange": AgeRange,
+  "workExperienceRange": WorkExperienceRange,
+  "industryTypeLarge": IndustryTypeLarge,
+  "industryTypeMedium": IndustryTypeMedium,
+  "workforceSizeRange": WorkforceSizeRange,
+  "worker": Worker,
+}
+
+varNameToResponseModel = {
+  "incident": IncidentResponse,
+  "factory": FactoryResponse,
+  "threatType": ThreatTypeResponse,
+  "workType": WorkTypeResponse,
+  "checkQuestion": CheckQuestionResponse,
+  "ageRange": AgeRangeResponse,
+  "workExperienceRange": WorkExperienceRangeResponse,
+  "industryTypeLarge": IndustryTypeLargeResponse,
+  "industryTypeMedium": IndustryTypeMediumResponse,
+  "workforceSizeRange": WorkforceSizeRangeResponse,
+  "worker": WorkerResponse,
+}
+
+def chunked(values: list, size: int = IN_CLAUSE_CHUNK_SIZE):
+  for start in range(0, len(values), size):
+    yield values[start:start + size]
+
+def encodeJsonDefault(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumpJson(content) -> bytes:
+  """Encode plain dicts/lists exactly as FastAPI would encode the equivalent response model."""
+  if orjson is not None:
+    return orjson.dumps(content)
+  return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=encodeJsonDefault).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+  """
+  JSONResponse for content that is already made of plain dicts, lists, scalars
+  and datetimes. Returning it from an endpoint skips FastAPI's validation and
+  serialization against response_model, which then only documents the schema.
+  """
+
+  def render(self, content) -> bytes:
+    return dumpJson(content)
+
+@cache
+def referenceColumns(table) -> tuple:
+  """(column key, varName) of every `*_id` column of `table`."""
+  return tuple((column.key, column.key.replace("_id", "")) for column in table.columns if column.key.endswith("_id"))
+
+@cache
+def fieldPlan(varName: str) -> tuple:
+  """
+  (field, relatedName) for each field of the response model of `varName`, in
+  response field order. relatedName is the varName of the row referenced through
+  the `<field>_id` column, or None for a field read straight from the row (or
+  passed in as an additional attribute).
+  """
+  columns = {column.key for column in varNameToModel[varName].__table__.columns}
+  return tuple(
+    (field, field if field not in columns and f"{field}_id" in columns else None)
+    for field in varNameToResponseModel[varName].model_fields
+  )
+
+class BatchSerializer:
+  """
+  Builds response models for a batch of rows from in-memory maps.
+  Every row referenced through a `*_id` column is loaded with one IN query
+  per referenced table (per level of nesting), instead of one query per row.
+  Lookup tables are served from the reference data cache without querying.
+  """
+
+  def __init__(self, db: Session):
+    self.db = db
+    # varName -> {id: db row}
+    self.loaded = defaultdict(dict)
+    # (varName, id) -> response model, shared between rows referencing the same entity
+    self.built = {}
+    # (varName, id) -> response dict, likewise for buildDict
+    self.builtDicts = {}
+
+  def load(self, rows: list):
+    """Batch load every row referenced by `rows`, recursing into the referenced rows."""
+    pendingIds = defaultdict(set)
+    for row in rows:
+      for key, varName in referenceColumns(row.__table__):
+        pendingIds[varName].add(getattr(row, key))
+
+    for varName, ids in pendingIds.items():
+      if varName in referenceModels:
+        continue
+      known = self.loaded[varName]
+      missingIds = sorted(id for id in ids if id is not None and id not in known)
+      if not missingIds:
+        continue
+      model = varNameToModel[varName]
+      fetched = []
+      for idChunk in chunked(missingIds):
+        fetched.extend(self.db.query(model).filter(model.id.in_(idChunk)).all())
+      for row in fetched:
+        known[row.id] = row
+      self.load(fetched)
+
+  def forgetLoadedRows(self):
+    """Drop the loaded rows and everything built from them; built reference data is kept."""
+    self.loaded.clear()
+    self.built = {key: value for key, value in self.built.items() if key[0] in referenceModels}
+    self.builtDicts = {key: value for key, value in self.builtDicts.items() if key[0] in referenceModels}
+
+  def build(self, row, additionalAttributes: dict = {}) -> BaseModel:
+    """Build the response model of an already loaded row."""
+    varName = row.typeToString()
+    cacheKey = (varName, row.id)
+    if not additionalAttributes and cacheKey in self.built:
+      return self.built[cacheKey]
+
+    modelDict = {}
+    for column in row.__table__.columns:
+      key = column.key
+      value = getattr(row, key)
+      if key.endswith("_id"):
+        relatedName = key.replace("_id", "")
+        related = self.related(relatedName, value)
+        modelDict[relatedName] = related if relatedName in referenceModels else self.build(related)
+      else:
+        modelDict[key] = value
+    modelDict.update(additionalAttributes)
+    response = varNameToResponseModel[varName].model_validate(modelDict)
+    if not additionalAttributes:
+      self.built[cacheKey] = response
+    return response
+
+  def related(self, relatedName: str, id: int):
+    if relatedName in referenceModels:
+      related = referenceDataCache.get(self.db, relatedName, id)
+    else:
+      related = self.loaded[relatedName].get(id)
+    if related is None:
+      logger.error(f"{datetime.now()}: {relatedName} of id {id} not found")
+      raise HTTPException(status_code=404, detail=f"{relatedName} not found")
+    return related
+
+  def buildDict(self, row, additionalAttributes: dict = {}) -> dict:
+    """
+    Build the JSON-ready dict of an already loaded row, without creating response
+    models. Produces the same structure as build(row).model_dump(mode="json"),
+    apart from datetimes, which the JSON encoder formats.
+    """
+    varName = row.typeToString()
+    cacheKey = (varName, row.id)
+    if not additionalAttributes and cacheKey in self.builtDicts:
+      return self.builtDicts[cacheKey]
+
+    rowDict = {}
+    for field, relatedName in fieldPlan(varName):
+      if relatedName is None:
+        rowDict[field] = additionalAttributes[field] if field in additionalAttributes else getattr(row, field)
+      elif relatedName in referenceModels:
+        rowDict[field] = self.referenceDict(relatedName, getattr(row, f"{field}_id"))
+      else:
+        rowDict[field] = self.buildDict(self.related(relatedName, getattr(row, f"{field}_id")))
+    if not additionalAttributes:
+      self.builtDicts[cacheKey] = rowDict
+    return rowDict
+
+  def referenceDict(self, varName: str, id: int) -> dict:
+    cacheKey = (varName, id)
+    if cacheKey not in self.builtDicts:
+      self.builtDicts[cacheKey] = self.related(varName, id).model_dump()
+    return self.builtDicts[cacheKey]
+
+  def queryCheckResponses(self, incidentIds: list) -> list:
+    # Plain column rows: building ORM instances would cost more than the rest of the serialization
+    checkResponses = []
+    for idChunk in chunked(incidentIds):
+      checkResponses.extend(
+        self.db.query(CheckResponse.incident_id, CheckResponse.question_id, CheckResponse.response)
+        .filter(CheckResponse.incident_id.in_(idChunk))
+        .all()
+      )
+    return checkResponses
+
+  def loadCheckResponses(self, incidentIds: list) -> dict:
+    """Map incident id -> {CheckQuestionResponse: response} with one query per chunk of incidents."""
+    checkResponsesByIncident = {incidentId: dict() for incidentId in incidentIds}
+    for checkResponse in self.queryCheckResponses(incidentIds):
+      checkQuestion = referenceDataCache.get(self.db, "checkQuestion", checkResponse.question_id)
+      checkResponsesByIncident[checkResponse.incident_id][checkQuestion] = checkResponse.response
+    return checkResponsesByIncident
+
+  def loadCompactCheckResponses(self, incidentIds: list) -> dict:
+    """Map incident id -> [{"question_id", "response"}] ordered by question id."""
+    checkResponsesByIncident = {incidentId: [] for incidentId in incidentIds}
+    for incidentId, questionId, response in self.queryCheckResponses(incidentIds):
+      checkResponsesByIncident[incidentId].append({"question_id": questionId, "response": response})
+    for checkResponses in checkResponsesByIncident.values():
+      checkResponses.sort(key=lambda checkResponse: checkResponse["question_id"])
+    return checkResponsesByIncident
+
+  def loadCheckResponseDicts(self, incidentIds: list) -> dict:
+    """Like loadCheckResponses, keyed by the JSON key of each question (its model's str(), as in the response model's output)."""
+    questionKeys = {}
+    checkResponsesByIncident = {incidentId: dict() for incidentId in incidentIds}
+    for checkResponse in self.queryCheckResponses(incidentIds):
+      questionId = checkResponse.question_id
+      if questionId not in questionKeys:
+        questionKeys[questionId] = str(referenceDataCache.get(self.db, "checkQuestion", questionId))
+      checkResponsesByIncident[checkResponse.incident_id][questionKeys[questionId]] = checkResponse.response
+    return checkResponsesByIncident
+
+def serializeRows(rows: list, db: Session) -> list:
+  serializer = BatchSerializer(db)
+  serializer.load(rows)
+  return [serializer.build(row) for row in rows]
+
+def serializeIncidents(incidents: list[Incident], db: Session) -> list[IncidentResponse]:
+  serializer = BatchSerializer(db)
+  serializer.load(incidents)
+  checkResponses = serializer.loadCheckResponses([incident.id for incident in incidents])
+  return [
+    serializer.build(incident, additionalAttributes={"check_responses": checkResponses[incident.id]})
+    for incident in incidents
+  ]
+
+def serializeRowDicts(rows: list, db: Session) -> list[dict]:
+  serializer = BatchSerializer(db)
+  serializer.load(rows)
+  return [serializer.buildDict(row) for row in rows]
+
+def serializeIncidentDicts(incidents: list[Incident], db: Session, checkResponseFormat: CheckResponseFormat = "full", serializer: BatchSerializer = None) -> list[dict]:
+  """serializeIncidents for FastJSONResponse: plain dicts, no response models."""
+  serializer = serializer or BatchSerializer(db)
+  serializer.load(incidents)
+  incidentIds = [incident.id for incident in incidents]
+  if checkResponseFormat == "compact":
+    checkResponses = serializer.loadCompactCheckResponses(incidentIds)
+  else:
+    checkResponses = serializer.loadCheckResponseDicts(incidentIds)
+  return [
+    serializer.buildDict(incident, additionalAttributes={"check_responses": checkResponses[incident.id]})
+    for incident in incidents
+  ]
+
+def checkQuestionCatalog(db: Session) -> list[dict]:
+  return [checkQuestion.model_dump() for checkQuestion in referenceDataCache.getAll(db, "checkQuestion")]
+
+def incidentListContent(incidents: list[Incident], nextCursor: str, db: Session, checkResponseFormat: CheckResponseFormat = "full") -> dict:
+  """Content of IncidentResponses, or of CompactIncidentResponses with the question catalog."""
+  content = {"incidents": serializeIncidentDicts(incidents, db, checkResponseFormat), "nextCursor": nextCursor}
+  if checkResponseFormat == "compact":
+    content["checkQuestions"] = checkQuestionCatalog(db)
+  return content
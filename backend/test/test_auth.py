@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import os
 import pytest
@@ -13,19 +14,26 @@ from jose import jwt
 # Add the project root directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
+from db_engine import createEngine
 from auth.auth_db import Base, User, get_db
 from auth.auth_model import CreateUser, Token
-from auth.auth import validateUsername, validatePassword, authenticateUser, createAccessToken, getCurrentUser, bcrypt_context
+from auth.auth import validateUsername, validatePassword, authenticateUser, createAccessToken, getCurrentUser
+from auth.auth_settings import reloadAuthSettings
+from auth.password_hashing import PasswordHasher, bcrypt_context, passwordHasher
+from auth.token_cache import VerifiedTokenCache, tokenCache
 from main import app
 
-# Setup test database
-TEST_DATABASE_URL = "sqlite:///:memory:"
+# Setup test database, in memory unless TEST_DATABASE_URL points at another backend
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
 
-engine = create_engine(
-  TEST_DATABASE_URL,
-  connect_args={"check_same_thread": False},
-  poolclass=StaticPool
-)
+if TEST_DATABASE_URL:
+  engine = createEngine(TEST_DATABASE_URL)
+else:
+  engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+  )
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -36,6 +44,12 @@ Base.metadata.create_all(bind=engine)
 client = TestClient(app)
 
 # Fixtures
+@pytest.fixture(autouse=True)
+def authSettings():
+  # Settings are read once; tests that patch the environment reload them, so restore afterwards
+  yield
+  reloadAuthSettings()
+
 @pytest.fixture
 def testDb():
   db = TestingSessionLocal()
@@ -140,20 +154,21 @@ def testCreateUserWeakPassword(testDb):
 
 # Tests for authentication
 def testAuthenticateUserSuccess(testUser, testDb):
-  result = authenticateUser("testuser", "Test1234!", testDb)
+  result = asyncio.run(authenticateUser("testuser", "Test1234!", testDb))
   assert result is True
 
 def testAuthenticateUserInvalidUsername(testUser, testDb):
-  result = authenticateUser("wronguser", "Test1234!", testDb)
+  result = asyncio.run(authenticateUser("wronguser", "Test1234!", testDb))
   assert result is False
 
 def testAuthenticateUserInvalidPassword(testUser, testDb):
-  result = authenticateUser("testuser", "WrongPass123!", testDb)
+  result = asyncio.run(authenticateUser("testuser", "WrongPass123!", testDb))
   assert result is False
 
 # Tests for token generation and validation
 @patch.dict(os.environ, {"AUTH_KEY": "testsecretkey", "ALGORITHM": "HS256", "ACCESS_TOKEN_EXPIRE_MINUTES": "30"})
 def testCreateAccessToken():
+  reloadAuthSettings()
   token = createAccessToken("testuser")
   decoded = jwt.decode(token, "testsecretkey", algorithms=["HS256"])
   assert decoded["sub"] == "testuser"
@@ -164,6 +179,7 @@ def testCreateAccessToken():
 
 @patch.dict(os.environ, {"AUTH_KEY": "testsecretkey", "ALGORITHM": "HS256"})
 def testGetCurrentUserSuccess():
+  reloadAuthSettings()
   # Create a valid token
   payload = {
     "sub": "testuser",
@@ -176,10 +192,49 @@ def testGetCurrentUserSuccess():
 
 @patch.dict(os.environ, {"AUTH_KEY": "testsecretkey", "ALGORITHM": "HS256"})
 def testGetCurrentUserInvalidToken():
+  reloadAuthSettings()
   with pytest.raises(Exception) as excinfo:
     getCurrentUser("invalid.token.string")
   assert "Could not validate credentials" in str(excinfo.value)
 
+@patch.dict(os.environ, {"AUTH_KEY": "testsecretkey", "ALGORITHM": "HS256"})
+def testGetCurrentUserCachesVerifiedTokens():
+  reloadAuthSettings()
+  token = jwt.encode({"sub": "testuser", "exp": datetime.now(timezone.utc) + timedelta(minutes=30)}, "testsecretkey", algorithm="HS256")
+
+  with patch("auth.auth.jwt.decode", wraps=jwt.decode) as decode:
+    assert getCurrentUser(token)["username"] == "testuser"
+    assert getCurrentUser(token)["username"] == "testuser"
+  assert decode.call_count == 1
+  assert tokenCache.stats()["hits"] >= 1
+
+  # A new signing key invalidates every cached token
+  with patch.dict(os.environ, {"AUTH_KEY": "othersecretkey"}):
+    reloadAuthSettings()
+    with pytest.raises(Exception) as excinfo:
+      getCurrentUser(token)
+    assert "Could not validate credentials" in str(excinfo.value)
+
+def testTokenCacheEvictsAtExpiryAndWhenFull():
+  cache = VerifiedTokenCache(maxSize=2)
+  now = datetime.now(timezone.utc).timestamp()
+  cache.put("expired", {"username": "a"}, now - 1)
+  assert cache.get("expired") is None
+
+  cache.put("soon", {"username": "b"}, now + 60)
+  with patch("auth.token_cache.time.time", return_value=now + 61):
+    assert cache.get("soon") is None
+  assert cache.stats()["expirations"] == 1
+
+  cache.put("first", {"username": "c"}, now + 60)
+  cache.put("second", {"username": "d"}, now + 60)
+  assert cache.get("first") == {"username": "c"}
+  cache.put("third", {"username": "e"}, now + 60)
+  # "second" was the least recently used
+  assert cache.get("second") is None
+  assert cache.get("first") is not None and cache.get("third") is not None
+  assert cache.stats()["evictions"] == 1
+
 # Tests for login endpoint
 def testLoginSuccess(testUser):
   response = client.post(
@@ -198,6 +253,42 @@ def testLoginInvalidCredentials(testUser):
   assert response.status_code == 401
   assert "Invalid username or password" in response.json()["detail"]
 
+def testLoginVerifiesOnPasswordHashingPool(testUser):
+  completedBefore = passwordHasher.stats()["completed"]
+  response = client.post(
+    "/auth/token",
+    data={"username": "testuser", "password": "Test1234!"}
+  )
+  assert response.status_code == 200
+  assert passwordHasher.stats()["completed"] == completedBefore + 1
+
+def testPasswordHasherShedsLoadWhenQueueIsFull():
+  import threading
+  from fastapi import HTTPException
+
+  hasher = PasswordHasher(bcrypt_context, maxWorkers=1, maxQueue=1)
+  release = threading.Event()
+
+  async def burst():
+    # One call runs, one waits in the queue, the third is rejected
+    calls = [asyncio.ensure_future(hasher.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    assert hasher.stats()["running"] == 1
+    assert hasher.stats()["queueDepth"] == 1
+    with pytest.raises(HTTPException) as excinfo:
+      await hasher.run(release.wait)
+    release.set()
+    await asyncio.gather(*calls)
+    return excinfo.value
+
+  rejection = asyncio.run(burst())
+  assert rejection.status_code == 503
+  stats = hasher.stats()
+  assert stats["completed"] == 2
+  assert stats["rejected"] == 1
+  assert stats["peakQueueDepth"] == 1
+  hasher.executor.shutdown()
+
 # Tests for validation functions
 def testValidateUsernameSuccess(testDb):
   assert validateUsername("validuser", testDb) is True
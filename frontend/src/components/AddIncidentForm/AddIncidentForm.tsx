@@ -41,6 +41,9 @@ const AddIncidentForm = ({
   const [workTypes, setWorkTypes] = useState<Category[]>([]);
   const [workType_id, setWorkTypeId] = useState<number>(-1);
   const [checks, setChecks] = useState(new Map<string, boolean | null>());
+  const [checkQuestionIds, setCheckQuestionIds] = useState(
+    new Map<string, number>()
+  );
   const [name, setName] = useState<string>("");
   const [ageRange, setAgeRange] = useState<Category[]>([]);
   const [ageRange_id, setAgeRangeId] = useState<number>(-1);
@@ -62,11 +65,11 @@ const AddIncidentForm = ({
 
   const handleSubmit = (e: React.FormEvent<HTMLFormElement>) => {
     e.preventDefault();
-    // nullcheck all entries in checks
+    // nullcheck all entries in checks, keyed by question id for the API
     const checksResponse: Map<string, boolean> = new Map();
     for (const [key, value] of checks.entries()) {
       if (value !== null) {
-        checksResponse.set(key, value);
+        checksResponse.set(String(checkQuestionIds.get(key)), value);
         checks.set(key, value);
       }
     }
@@ -107,120 +110,50 @@ const AddIncidentForm = ({
 
   useEffect(() => {
     const fetchData = async () => {
-      // Create individual fetch functions with their own error handling
-      const fetchFactories = async () => {
-        try {
-          const response = await api.get("/factories");
-          const factoryObjects = response.data.factories.map(
-            (item: any) => new Factory(item.id, item.name)
-          );
-          setFactories(factoryObjects);
-        } catch (error) {
-          console.error("Error fetching factories:", error);
-          // You could set an error state here for factories specifically
-        }
-      };
+      // One request for every list in the form; the server answers 304 when the browser's copy is current
+      try {
+        const response = await api.get("/referenceData");
+        const data = response.data;
+        setFactories(
+          data.factories.map((item: any) => new Factory(item.id, item.name))
+        );
+        setThreatTypes(
+          data.threatTypes.map((item: any) => new Category(item.id, item.name))
+        );
+        setWorkTypes(
+          data.workTypes.map((item: any) => new Category(item.id, item.name))
+        );
 
-      const fetchThreatTypes = async () => {
-        try {
-          const response = await api.get("/threatTypes");
-          const threatTypeObjects = response.data.threatTypes.map(
-            (item: any) => new Category(item.id, item.name)
-          );
-          setThreatTypes(threatTypeObjects);
-        } catch (error) {
-          console.error("Error fetching threat types:", error);
-          // You could set an error state here for threat types specifically
+        const checkObjects: Map<string, boolean | null> = new Map();
+        const questionIds: Map<string, number> = new Map();
+        for (const item of data.checks) {
+          checkObjects.set(item.question, null);
+          questionIds.set(item.question, item.id);
         }
-      };
+        setChecks(checkObjects);
+        setCheckQuestionIds(questionIds);
 
-      const fetchWorkTypes = async () => {
-        try {
-          const response = await api.get("/workTypes");
-          const workTypeObjects = response.data.workTypes.map(
-            (item: any) => new Category(item.id, item.name)
-          );
-          setWorkTypes(workTypeObjects);
-        } catch (error) {
-          console.error("Error fetching work types:", error);
-          // You could set an error state here for work types specifically
-        }
-      };
-
-      const fetchChecks = async () => {
-        try {
-          const response = await api.get("/checks");
-          const checkObjects: Map<string, boolean | null> = new Map();
-          for (const item of response.data.checks) {
-            checkObjects.set(item.question, null);
-          }
-          setChecks(checkObjects);
-        } catch (error) {
-          console.error("Error fetching checks:", error);
-        }
-      };
-
-      const fetchAgeRanges = async () => {
-        try {
-          const response = await api.get("/ageRanges");
-          const ageRangeObjects = response.data.ageRanges.map(
+        setAgeRange(
+          data.ageRanges.map((item: any) => new Category(item.id, item.range))
+        );
+        setWorkExperienceRange(
+          data.workExperienceRanges.map(
             (item: any) => new Category(item.id, item.range)
-          );
-          setAgeRange(ageRangeObjects);
-        } catch (error) {
-          console.error("Error fetching age ranges:", error);
-        }
-      };
-
-      const fetchWorkExperienceRanges = async () => {
-        try {
-          const response = await api.get("/workExperienceRanges");
-          const workExperienceRangeObjects =
-            response.data.workExperienceRanges.map(
-              (item: any) => new Category(item.id, item.range)
-            );
-          setWorkExperienceRange(workExperienceRangeObjects);
-        } catch (error) {
-          console.error("Error fetching work experience ranges:", error);
-        }
-      };
-
-      const fetchIndustryTypesLarge = async () => {
-        try {
-          const response = await api.get("/industryTypes/large");
-          const industryTypeLargeObjects = response.data.industryTypeLarge.map(
+          )
+        );
+        setIndustryTypeLarge(
+          data.industryTypeLarge.map(
             (item: any) => new Category(item.id, item.name)
-          );
-          setIndustryTypeLarge(industryTypeLargeObjects);
-        } catch (error) {
-          console.error("Error fetching large industry types:", error);
-        }
-      };
-
-      const fetchIndustryTypesMedium = async () => {
-        try {
-          const response = await api.get("/industryTypes/medium");
-          const industryTypeMediumObjects =
-            response.data.industryTypeMedium.map(
-              (item: any) => new Category(item.id, item.name)
-            );
-          setIndustryTypeMedium(industryTypeMediumObjects);
-        } catch (error) {
-          console.error("Error fetching medium industry types:", error);
-        }
-      };
-
-      // Execute all requests concurrently, but handle errors independently
-      await Promise.allSettled([
-        fetchFactories(),
-        fetchThreatTypes(),
-        fetchWorkTypes(),
-        fetchChecks(),
-        fetchAgeRanges(),
-        fetchWorkExperienceRanges(),
-        fetchIndustryTypesLarge(),
-        fetchIndustryTypesMedium(),
-      ]);
+          )
+        );
+        setIndustryTypeMedium(
+          data.industryTypeMedium.map(
+            (item: any) => new Category(item.id, item.name)
+          )
+        );
+      } catch (error) {
+        console.error("Error fetching reference data:", error);
+      }
     };
     fetchData();
   }, []);
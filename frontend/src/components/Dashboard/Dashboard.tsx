@@ -1,45 +1,102 @@
+import { useState, useEffect } from "react";
 import "./Dashboard.css";
 import BarChart from "../Charts/BarChart";
-import PieChart from "../Charts/PieChart";
-import LineChart from "../Charts/LineChart";
+import PieChart, { type PieChartData } from "../Charts/PieChart";
+import LineChart, { type LineChartData } from "../Charts/LineChart";
+import api from "../../api";
+
+type BarChartRow = { name: string; [key: string]: string | number };
+type LineChartLine = { dataKey: string; color: string };
+type FactoryRiskIndex = { factory_id: number; factory: string; riskIndex: number };
+
+const COLORS = [
+  "#E57300",
+  "#FF8C1A",
+  "#FA9E00",
+  "#FFB61A",
+  "#FAA700",
+  "#FFBE1A",
+];
 
 const Dashboard = () => {
-  // Mock data for pie chart
-  const pieChartData = [
-    { name: "추락", value: 30 },
-    { name: "화상", value: 20 },
-    { name: "감전", value: 10 },
-    { name: "절단", value: 40 },
-  ];
+  const [pieChartData, setPieChartData] = useState<PieChartData[]>([]);
+  const [barChartData, setBarChartData] = useState<BarChartRow[]>([]);
+  const [lineChartData, setLineChartData] = useState<LineChartData[]>([]);
+  const [lineChartLines, setLineChartLines] = useState<LineChartLine[]>([]);
+  const [riskIndexes, setRiskIndexes] = useState<FactoryRiskIndex[]>([]);
+
+  useEffect(() => {
+    // One small aggregated request per chart instead of downloading every incident
+    const fetchThreatTypeCounts = async () => {
+      try {
+        const response = await api.get("/analytics/threatTypes");
+        setPieChartData(
+          response.data.counts.map((item: any) => ({
+            name: item.threatType.name,
+            value: item.count,
+          }))
+        );
+      } catch (error) {
+        console.error("Error fetching threat type counts:", error);
+      }
+    };
 
-  // Bar chart data reformatted for recharts
-  const barChartData = [
-    { name: "평택 공장", 떨어짐: 4.2, 넘어짐: 2.4, 화재: 2.1 },
-    { name: "청주 공장", 떨어짐: 3.8, 넘어짐: 2.1, 화재: 1.9 },
-    { name: "대전 공장", 떨어짐: 3.2, 넘어짐: 1.8, 화재: 1.5 },
-  ];
+    const fetchFactoryThreatTypeCounts = async () => {
+      try {
+        const response = await api.get("/analytics/factories/threatTypes");
+        const rowsByFactory = new Map<number, BarChartRow>();
+        response.data.counts.forEach((item: any) => {
+          const row = rowsByFactory.get(item.factory_id) ?? { name: item.factory };
+          row[item.threatType.name] = item.count;
+          rowsByFactory.set(item.factory_id, row);
+        });
+        setBarChartData(Array.from(rowsByFactory.values()));
+      } catch (error) {
+        console.error("Error fetching factory threat type counts:", error);
+      }
+    };
 
-  const lineChartData = [
-    { date: "1월", 평택: 4.5, 청주: 7.2, 대전: 3.0 },
-    { date: "2월", 평택: 5.0, 청주: 7.0, 대전: 3.5 },
-    { date: "3월", 평택: 5.2, 청주: 7.5, 대전: 3.2 },
-    { date: "4월", 평택: 5.5, 청주: 7.4, 대전: 3.2 },
-  ];
+    const fetchFactoryMonthlyCounts = async () => {
+      try {
+        const response = await api.get("/analytics/factories/monthly");
+        const rowsByMonth = new Map<string, LineChartData>();
+        const factoryNames: string[] = [];
+        response.data.counts.forEach((item: any) => {
+          const row = rowsByMonth.get(item.month) ?? { date: item.month };
+          row[item.factory] = item.count;
+          rowsByMonth.set(item.month, row);
+          if (!factoryNames.includes(item.factory)) {
+            factoryNames.push(item.factory);
+          }
+        });
+        setLineChartData(Array.from(rowsByMonth.values()));
+        setLineChartLines(
+          factoryNames.map((factoryName, index) => ({
+            dataKey: factoryName,
+            color: COLORS[index % COLORS.length],
+          }))
+        );
+      } catch (error) {
+        console.error("Error fetching factory monthly counts:", error);
+      }
+    };
 
-  const lineChartLines = [
-    { dataKey: "평택", color: "#E57300" },
-    { dataKey: "청주", color: "#FF8C1A" },
-    { dataKey: "대전", color: "#FFB61A" },
-  ];
+    const fetchRiskIndexes = async () => {
+      try {
+        const response = await api.get("/analytics/riskIndex");
+        setRiskIndexes(response.data.factories);
+      } catch (error) {
+        console.error("Error fetching risk indexes:", error);
+      }
+    };
 
-  const COLORS = [
-    "#E57300",
-    "#FF8C1A",
-    "#FA9E00",
-    "#FFB61A",
-    "#FAA700",
-    "#FFBE1A",
-  ];
+    Promise.all([
+      fetchRiskIndexes(),
+      fetchThreatTypeCounts(),
+      fetchFactoryThreatTypeCounts(),
+      fetchFactoryMonthlyCounts(),
+    ]);
+  }, []);
 
   return (
     <div className="container">
@@ -47,30 +104,16 @@ const Dashboard = () => {
         <div className="dashboardCell">
           <h2 className="cardTitle">위험도 지수</h2>
           <div className="card">
-            <div className="FactoryRiskBox">
-              <div className="FactoryRiskScore">
-                <p>5.5</p>
-              </div>
-              <div className="FactoryName">
-                <p>평택 공장</p>
-              </div>
-            </div>
-            <div className="FactoryRiskBox">
-              <div className="FactoryRiskScore">
-                <p>7.4</p>
+            {riskIndexes.map((riskIndex) => (
+              <div className="FactoryRiskBox" key={riskIndex.factory_id}>
+                <div className="FactoryRiskScore">
+                  <p>{riskIndex.riskIndex.toFixed(1)}</p>
+                </div>
+                <div className="FactoryName">
+                  <p>{riskIndex.factory}</p>
+                </div>
               </div>
-              <div className="FactoryName">
-                <p>청주 공장</p>
-              </div>
-            </div>
-            <div className="FactoryRiskBox">
-              <div className="FactoryRiskScore">
-                <p>3.2</p>
-              </div>
-              <div className="FactoryName">
-                <p>대전 공장</p>
-              </div>
-            </div>
+            ))}
           </div>
         </div>
         <div className="dashboardCell">
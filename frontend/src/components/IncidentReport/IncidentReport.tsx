@@ -27,27 +27,25 @@ const IncidentReport = () => {
     description: string
   ) => {
     try {
-      const newWorker = {
-        name: name,
-        ageRange_id: ageRange_id,
-        sex: sex,
-        workExperienceRange_id: workExperienceRange_id,
-      };
-      const newWorkerResponse = await api.post("/workers", newWorker);
-      const newWorkerId = newWorkerResponse.data.id;
-      const newIncident = {
-        worker_id: newWorkerId,
+      // The worker and the incident are created together in one request and transaction
+      const newReport = {
+        worker: {
+          name: name,
+          ageRange_id: ageRange_id,
+          sex: sex,
+          workExperienceRange_id: workExperienceRange_id,
+        },
         industryTypeLarge_id: industryTypeLarge_id,
         industryTypeMedium_id: industryTypeMedium_id,
         threatType_id: threatType_id,
         threatLevel: threatLevel,
         workType_id: workType_id,
-        checks: Array.from(checks.entries()),
+        check_responses: Object.fromEntries(checks),
         description: description,
         date: date.toISOString(),
         factory_id: factory_id,
       };
-      await api.post("/incidents", newIncident);
+      await api.post("/reports", newReport);
       setNotification({
         show: true,
         message: "신고가 성공적으로 제출되었습니다.",
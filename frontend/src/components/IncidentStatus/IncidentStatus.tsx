@@ -6,6 +6,76 @@ import { Factory } from "../../models/Factory";
 import { Incident } from "../../models/Incident";
 import "./IncidentStatus.css";
 
+// How often the selected factory's incidents are re-synced while the live feed is down
+const SYNC_INTERVAL_MS = 30000;
+const SYNC_PAGE_SIZE = 1000;
+
+// Incidents already downloaded per factory and the sync cursor after them.
+// Kept outside the component so switching factories or pages only fetches what changed.
+type FactorySync = { cursor: string | null; incidents: Map<number, any> };
+const syncedFactories = new Map<number, FactorySync>();
+// Syncs in progress, so overlapping refreshes share one request chain
+const runningSyncs = new Map<number, Promise<FactorySync>>();
+
+const toIncident = (item: any) =>
+  new Incident(
+    item.id,
+    item.worker,
+    item.threatType,
+    item.threatLevel,
+    item.workType,
+    item.checks,
+    item.description,
+    item.date,
+    item.factory,
+    item.additionalData
+  );
+
+// Newest first, as /incidents/factory/{id} returns them
+const sortedIncidents = (state: FactorySync) =>
+  Array.from(state.incidents.values())
+    .sort((a, b) => (a.date < b.date ? 1 : a.date > b.date ? -1 : b.id - a.id))
+    .map(toIncident);
+
+// Apply the changes since the factory's cursor; the first sync downloads everything once
+const applyChanges = async (factoryId: number): Promise<FactorySync> => {
+  const state = syncedFactories.get(factoryId) ?? {
+    cursor: null,
+    incidents: new Map<number, any>(),
+  };
+  let hasMore = true;
+  while (hasMore) {
+    const response: any = await api.get("/incidents/sync", {
+      params: {
+        factory_id: factoryId,
+        limit: SYNC_PAGE_SIZE,
+        ...(state.cursor ? { cursor: state.cursor } : {}),
+      },
+    });
+    for (const item of response.data.incidents) {
+      state.incidents.set(item.id, item);
+    }
+    for (const id of response.data.deleted) {
+      state.incidents.delete(id);
+    }
+    state.cursor = response.data.cursor;
+    hasMore = response.data.hasMore;
+  }
+  syncedFactories.set(factoryId, state);
+  return state;
+};
+
+const syncFactory = (factoryId: number): Promise<FactorySync> => {
+  let running = runningSyncs.get(factoryId);
+  if (!running) {
+    running = applyChanges(factoryId).finally(() =>
+      runningSyncs.delete(factoryId)
+    );
+    runningSyncs.set(factoryId, running);
+  }
+  return running;
+};
+
 const IncidentStatus = () => {
   // Choose current factory
   const [factory, setFactory] = useState<Factory>(
@@ -57,38 +127,55 @@ const IncidentStatus = () => {
   }, []);
 
   useEffect(() => {
+    let cancelled = false;
     const fetchIncidents = async () => {
       try {
-        setIsLoadingIncidents(true);
-        const response: any = await api.get(`/incidents/factory/${factory.id}`);
-        const incidentObjects = response.data.incidents.map(
-          (item: any) =>
-            new Incident(
-              item.id,
-              item.worker,
-              item.threatType,
-              item.threatLevel,
-              item.workType,
-              item.checks,
-              item.description,
-              item.date,
-              item.factory,
-              item.additionalData
-            )
-        );
-        setIncidents(incidentObjects);
+        const state = await syncFactory(factory.id);
+        if (!cancelled) {
+          setIncidents(sortedIncidents(state));
+        }
       } catch (error) {
         console.error(
           `Failed to fetch incidents for factory ${factory.id}:`,
           error
         );
-        setIncidents([]);
+        if (!cancelled && !syncedFactories.has(factory.id)) {
+          setIncidents([]);
+        }
       } finally {
-        setIsLoadingIncidents(false);
+        if (!cancelled) {
+          setIsLoadingIncidents(false);
+        }
       }
     };
     if (factory.id !== -1) {
+      // Show what was synced before right away, then fetch only the changes
+      const cached = syncedFactories.get(factory.id);
+      if (cached) {
+        setIncidents(sortedIncidents(cached));
+        setIsLoadingIncidents(false);
+      } else {
+        setIsLoadingIncidents(true);
+      }
       fetchIncidents();
+      // New incidents are pushed as they are reported; each one, a (re)connection or a
+      // reset (missed events the server no longer has) triggers a sync of the changes
+      const source = new EventSource(
+        `${api.defaults.baseURL}/incidents/live?factory_id=${factory.id}`
+      );
+      source.onopen = fetchIncidents;
+      source.addEventListener("incident", fetchIncidents);
+      source.addEventListener("reset", fetchIncidents);
+      const interval = setInterval(() => {
+        if (source.readyState !== EventSource.OPEN) {
+          fetchIncidents();
+        }
+      }, SYNC_INTERVAL_MS);
+      return () => {
+        cancelled = true;
+        source.close();
+        clearInterval(interval);
+      };
     }
   }, [factory]);
 